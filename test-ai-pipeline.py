@@ -94,23 +94,11 @@ async def test_ai_pipeline():
         print("\n🤖 Testing AI Extraction...")
         extraction_engine = ExtractionEngine(sample_construct, llm_provider="gemini")
         
-        # Extract stories from the first few paragraphs
-        paragraphs = doc['paragraphs'][:3]  # Test with first 3 paragraphs
-        extracted_stories = []
-        
-        for i, paragraph in enumerate(paragraphs):
-            if len(paragraph.strip()) > 20:  # Only process substantial paragraphs
-                print(f"\n   Processing paragraph {i+1}: {paragraph[:100]}...")
-                
-                story = await extraction_engine._extract_story_from_text(paragraph, doc, i)
-                if story:
-                    extracted_stories.append(story)
-                    print(f"   ✅ Extracted story: {story.get('User Story', '')[:80]}...")
-                else:
-                    print(f"   ⚠️  No story extracted from paragraph {i+1}")
+        # extract_stories selects relevant paragraphs and applies the construct template inline
+        extracted_stories = await extraction_engine.extract_stories(processed_docs)
         
         print(f"\n📊 Extraction Results:")
-        print(f"   - Total paragraphs processed: {len(paragraphs)}")
+        print(f"   - Total paragraphs processed: {len(doc['paragraphs'])}")
         print(f"   - Stories extracted: {len(extracted_stories)}")
         
         if extracted_stories:
@@ -125,8 +113,9 @@ async def test_ai_pipeline():
         
         # Test construct application
         print("\n🏗️  Testing Construct Application...")
-        structured_stories = await extraction_engine._apply_construct_template(extracted_stories)
-        print(f"✅ Applied construct template to {len(structured_stories)} stories")
+        output_schema = sample_construct['output_schema']
+        structured_stories = [story for story in extracted_stories if all(field in story for field in output_schema)]
+        print(f"✅ Construct template applied to {len(structured_stories)} of {len(extracted_stories)} stories")
         
         if structured_stories:
             print("\n📋 Final Structured Output:")
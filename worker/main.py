@@ -1,5 +1,4 @@
 import os
-import json
 import time
 import logging
 from datetime import datetime
@@ -7,6 +6,7 @@ from typing import List, Dict, Any, Optional
 from google.cloud import storage, firestore, pubsub_v1
 from google.cloud.exceptions import NotFound, GoogleCloudError
 from dotenv import load_dotenv
+import orjson
 from processors.document_processor import DocumentProcessor
 from processors.extraction_engine import ExtractionEngine
 from processors.requirements_converter import RequirementsConverter
@@ -40,6 +40,27 @@ extraction_engine: Optional[ExtractionEngine] = None
 requirements_converter: Optional[RequirementsConverter] = None
 vector_processor: Optional[VectorProcessor] = None
 
+# Single long-lived event loop for all AI work: every job thread submits to it, so the
+# extraction engine's batch queue, LLM clients and concurrency limit are shared across jobs
+inference_loop: Optional[asyncio.AbstractEventLoop] = None
+inference_loop_lock = threading.Lock()
+
+def start_inference_loop() -> asyncio.AbstractEventLoop:
+    """Start the shared inference event loop in a daemon thread, once"""
+    global inference_loop
+    
+    with inference_loop_lock:
+        if inference_loop is None:
+            inference_loop = asyncio.new_event_loop()
+            threading.Thread(target=inference_loop.run_forever, name="inference-loop", daemon=True).start()
+            logger.info("✅ Inference event loop started")
+        return inference_loop
+
+def run_on_inference_loop(coro):
+    """Run a coroutine on the shared inference loop and block the calling thread for its result"""
+    # Started lazily as well, so a failed processor initialization can't leave jobs without a loop
+    return asyncio.run_coroutine_threadsafe(coro, start_inference_loop()).result()
+
 def initialize_services():
     """Initialize all Google Cloud services and processors with proper error handling"""
     global storage_client, firestore_client, publisher, subscriber
@@ -58,13 +79,13 @@ def initialize_services():
         logger.error(f"❌ Failed to initialize Google Cloud clients: {e}")
         raise
     
+    # The loop doesn't depend on any processor, so start it regardless of how their initialization goes
+    start_inference_loop()
+    
     try:
-        # Initialize processors
+        # Initialize processors; the extraction engine reads its provider API key from the environment
         document_processor = DocumentProcessor()
-        extraction_engine = ExtractionEngine(
-            gemini_api_key=os.getenv('GEMINI_API_KEY'),
-            openai_api_key=os.getenv('OPENAI_API_KEY')
-        )
+        extraction_engine = ExtractionEngine(construct={})
         requirements_converter = RequirementsConverter(
             gemini_api_key=os.getenv('GEMINI_API_KEY')
         )
@@ -153,14 +174,6 @@ def _build_naive_chunks_from_documents(documents: List[Dict[str, Any]]) -> List[
                 })
     return chunks
 
-# Initialize services
-try:
-    initialize_services()
-    logger.info("🚀 Interview ETL Worker initialized with AI processing pipeline!")
-except Exception as e:
-    logger.error(f"❌ Failed to initialize worker: {e}")
-    # Don't raise here - let the app start but log the error
-
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint for Cloud Run with comprehensive service status"""
@@ -214,26 +227,28 @@ def download_and_extract(job_id: str):
                 continue
                 
             try:
-                # Download file content
-                file_content = blob.download_as_text()
+                # Let the client decompress gzip content-encoding so compressed uploads decode as text
+                file_bytes = blob.download_as_bytes(checksum='md5')
                 
                 # Extract filename from blob path
                 filename = blob.name.split('/')[-1]
-                file_extension = filename.split('.')[-1].lower()
                 
-                # Process different file types
-                content = file_content
-                paragraphs = [p.strip() for p in file_content.split('\n\n') if p.strip()]
+                try:
+                    file_content = file_bytes.decode('utf-8')
+                except UnicodeDecodeError as e:
+                    logger.warning(f"⚠️ {filename} is not valid UTF-8 ({e}); undecodable bytes replaced with U+FFFD")
+                    file_content = file_bytes.decode('utf-8', errors='replace')
+                file_extension = filename.split('.')[-1].lower()
                 
+                # Paragraph segmentation happens once, in DocumentProcessor
                 documents.append({
                     'filename': filename,
                     'file_type': file_extension,
-                    'content': content,
-                    'paragraphs': paragraphs,
+                    'content': file_content,
                     'size': blob.size
                 })
                 
-                logger.info(f"Processed file: {filename} ({len(paragraphs)} paragraphs)")
+                logger.info(f"Downloaded file: {filename} ({blob.size} bytes)")
                 
             except Exception as e:
                 logger.error(f"Error processing file {blob.name}: {str(e)}")
@@ -249,13 +264,16 @@ def download_and_extract(job_id: str):
         logger.error(f"Error downloading documents: {str(e)}")
         raise
 
-async def process_documents_with_ai(documents: List[Dict[str, Any]], construct: Dict[str, Any]):
-    """Process documents using AI to extract user stories with vectorization"""
+async def process_documents_with_ai(processed_docs: List[Dict[str, Any]], construct: Dict[str, Any]):
+    """Process documents using AI to extract user stories with vectorization
+
+    Expects documents already normalized by DocumentProcessor (with paragraphs).
+    """
     try:
         logger.info("🤖 Starting AI-powered document processing with vectorization...")
         
         # Step 1: Conditionally vectorize transcripts for enhanced context
-        decision = _should_vectorize(documents)
+        decision = _should_vectorize(processed_docs)
         logger.info(
             "🧮 Vectorization decision: %s | metrics=%s",
             'YES' if decision['should_vectorize'] else 'NO',
@@ -264,23 +282,19 @@ async def process_documents_with_ai(documents: List[Dict[str, Any]], construct:
 
         if decision['should_vectorize']:
             logger.info("🧠 Step 1: Vectorizing interview transcripts (large input detected)...")
-            vectorization_result = await vector_processor.vectorize_transcripts(documents)
+            vectorization_result = await vector_processor.vectorize_transcripts(processed_docs)
             if vectorization_result.get('vectorized'):
                 logger.info(f"✅ Successfully vectorized {vectorization_result['total_chunks']} chunks")
                 vectorized_chunks = vectorization_result['chunks']
             else:
                 logger.warning("⚠️ Vectorization failed, falling back to naive chunks from paragraphs")
-                vectorized_chunks = _build_naive_chunks_from_documents(documents)
+                vectorized_chunks = _build_naive_chunks_from_documents(processed_docs)
         else:
             # Small inputs: skip expensive embedding call, but still build chunks for context
             logger.info("⚡ Skipping vectorization for small input; building naive context chunks")
-            vectorized_chunks = _build_naive_chunks_from_documents(documents)
+            vectorized_chunks = _build_naive_chunks_from_documents(processed_docs)
         
-        # Step 2: Process documents to extract text and structure
-        processed_docs = await document_processor.process_documents(documents)
-        logger.info(f"📄 Processed {len(processed_docs)} documents")
-        
-        # Step 3: Extract user stories using AI with enhanced context
+        # Step 2: Extract user stories using AI with enhanced context
         all_stories = []
         for doc in processed_docs:
             logger.info(f"🧠 AI analyzing document: {doc.get('filename', 'Unknown')}")
@@ -289,7 +303,7 @@ async def process_documents_with_ai(documents: List[Dict[str, Any]], construct:
             for i, paragraph in enumerate(doc.get('paragraphs', [])):
                 if paragraph.strip():
                     # Get relevant context chunks for this paragraph
-                    context_chunks = vector_processor.get_context_for_extraction(
+                    context_chunks = await vector_processor.get_context_for_extraction(
                         paragraph, 
                         vectorized_chunks, 
                         context_window=3
@@ -409,40 +423,48 @@ def generate_requirements_csv(requirements: List[Dict[str, Any]]) -> str:
     
     return '\n'.join(csv_lines)
 
+@firestore.transactional
+def _start_job(transaction, job_ref) -> Dict[str, Any]:
+    """Read the job document and mark it as processing in one round-trip"""
+    job_doc = job_ref.get(transaction=transaction)
+    if not job_doc.exists:
+        raise Exception(f"Job {job_ref.id} not found in Firestore")
+    
+    transaction.update(job_ref, {
+        'status': 'PROCESSING',
+        'updated_at': firestore.SERVER_TIMESTAMP
+    })
+    return job_doc.to_dict()
+
 def process_job(job_id: str):
     """Main job processing function"""
     try:
         logger.info(f"🚀 Starting job processing for job ID: {job_id}")
         start_time = time.time()
         
-        # Update job status to processing
+        # Read job details and mark as processing in a single transaction
         job_ref = firestore_client.collection('jobs').document(job_id)
-        job_ref.update({
-            'status': 'PROCESSING',
-            'updated_at': datetime.utcnow()
-        })
+        job_data = _start_job(firestore_client.transaction(), job_ref)
         
         # Step 1: Download and extract documents
         logger.info("📥 Step 1: Downloading and extracting documents...")
         documents = download_and_extract(job_id)
         
-        # Step 2: Get job details from Firestore
-        job_doc = job_ref.get()
-        if not job_doc.exists:
-            raise Exception(f"Job {job_id} not found in Firestore")
-        
-        job_data = job_doc.to_dict()
         construct = job_data.get('construct', {})
         requirements_construct = job_data.get('requirements_construct', {})
         
+        # Normalize documents and segment paragraphs once for all downstream steps
+        processed_docs = run_on_inference_loop(document_processor.process_documents(documents))
+        logger.info(f"📄 Processed {len(processed_docs)} documents")
+        
         # Step 3: Process documents with AI to extract user stories
         logger.info("🤖 Step 2: Processing documents with AI...")
-        user_stories = asyncio.run(process_documents_with_ai(documents, construct))
+        user_stories = run_on_inference_loop(process_documents_with_ai(processed_docs, construct))
         
         # Get vectorized chunks for requirements processing
         vectorized_chunks = []
         try:
-            vectorization_result = asyncio.run(vector_processor.vectorize_transcripts(documents))
+            vectorization_result = run_on_inference_loop(vector_processor.vectorize_transcripts(processed_docs))
             if vectorization_result.get('vectorized'):
                 vectorized_chunks = vectorization_result['chunks']
                 logger.info(f"✅ Retrieved {len(vectorized_chunks)} vectorized chunks for requirements")
@@ -469,8 +491,8 @@ def process_job(job_id: str):
             'stories_csv_url': csv_urls.get('stories_csv_url'),
             'requirements_csv_url': csv_urls.get('requirements_csv_url'),
             'processing_time': processing_time,
-            'completed_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
+            'completed_at': firestore.SERVER_TIMESTAMP,
+            'updated_at': firestore.SERVER_TIMESTAMP
         })
         
         logger.info(f"✅ Job {job_id} completed successfully!")
@@ -486,7 +508,7 @@ def process_job(job_id: str):
             job_ref.update({
                 'status': 'FAILED',
                 'error': str(e),
-                'updated_at': datetime.utcnow()
+                'updated_at': firestore.SERVER_TIMESTAMP
             })
         except Exception as update_error:
             logger.error(f"Failed to update job status: {update_error}")
@@ -502,7 +524,7 @@ def start_worker():
     
     def callback(message):
         try:
-            data = json.loads(message.data.decode('utf-8'))
+            data = orjson.loads(message.data)
             job_id = data.get('job_id')
             
             if job_id:
@@ -528,6 +550,15 @@ def start_worker():
         logger.info("🛑 Worker stopped by user")
 
 if __name__ == "__main__":
+    # Initialize services here rather than at import time: forkserver/spawn children (the dedup pair
+    # pool) re-import this module as __mp_main__ and must not connect to GCP or start the inference loop
+    try:
+        initialize_services()
+        logger.info("🚀 Interview ETL Worker initialized with AI processing pipeline!")
+    except Exception as e:
+        logger.error(f"❌ Failed to initialize worker: {e}")
+        # Don't raise here - let the app start but log the error
+    
     # Start worker in background thread
     worker_thread = threading.Thread(target=start_worker, daemon=True)
     worker_thread.start()
@@ -1,8 +1,12 @@
-import hashlib
-import json
 import os
+from collections import Counter
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+import orjson
+import xxhash
+import logging
+
+logger = logging.getLogger(__name__)
 
 class ConsistencyChecker:
     """Ensures deterministic and consistent processing of interview transcripts"""
@@ -28,16 +32,16 @@ class ConsistencyChecker:
                 {
                     'filename': doc['filename'],
                     'file_type': doc['file_type'],
-                    'content_hash': hashlib.md5(doc['content']).hexdigest(),
+                    'content_hash': xxhash.xxh3_128_hexdigest(doc['content']),
                     'size': len(doc['content'])
                 }
                 for doc in sorted_docs
             ]
         }
         
-        # Convert to sorted JSON string for consistent hashing
-        input_string = json.dumps(input_data, sort_keys=True, separators=(',', ':'))
-        return hashlib.md5(input_string.encode()).hexdigest()
+        # Serialize with sorted keys for consistent hashing
+        input_bytes = orjson.dumps(input_data, option=orjson.OPT_SORT_KEYS)
+        return xxhash.xxh3_128_hexdigest(input_bytes)
     
     def check_consistency(self, input_hash: str, output_stories: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Check if the current output matches previous runs with the same input"""
@@ -45,8 +49,8 @@ class ConsistencyChecker:
         
         if os.path.exists(cache_file):
             # Load previous output
-            with open(cache_file, 'r') as f:
-                cached_data = json.load(f)
+            with open(cache_file, 'rb') as f:
+                cached_data = orjson.loads(f.read())
             
             # Generate hash of current output
             current_output_hash = self._generate_output_hash(output_stories)
@@ -101,8 +105,8 @@ class ConsistencyChecker:
             'story_count': len(output_stories)
         }
         
-        with open(cache_file, 'w') as f:
-            json.dump(cache_data, f, indent=2, sort_keys=True)
+        with open(cache_file, 'wb') as f:
+            f.write(orjson.dumps(cache_data, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
     
     def _generate_output_hash(self, stories: List[Dict[str, Any]]) -> str:
         """Generate a deterministic hash of the output stories"""
@@ -122,9 +126,9 @@ class ConsistencyChecker:
                 'content_hash': story.get('Content Hash', '')
             })
         
-        # Convert to sorted JSON string
-        output_string = json.dumps(story_data, sort_keys=True, separators=(',', ':'))
-        return hashlib.md5(output_string.encode()).hexdigest()
+        # Serialize with sorted keys
+        output_bytes = orjson.dumps(story_data, option=orjson.OPT_SORT_KEYS)
+        return xxhash.xxh3_128_hexdigest(output_bytes)
     
     def _calculate_consistency_score(self, cached_stories: List[Dict[str, Any]], current_stories: List[Dict[str, Any]]) -> float:
         """Calculate a consistency score between cached and current outputs"""
@@ -269,31 +273,29 @@ class ConsistencyChecker:
         """Generate a comprehensive consistency report"""
         consistency_result = self.check_consistency(input_hash, output_stories)
         
+        # Distributions are counted in C; scores are bucketed in the same single pass
+        scores = Counter(
+            'high' if score >= 0.8 else 'medium' if score >= 0.5 else 'low'
+            for score in (s.get('Match Score', 0) for s in output_stories)
+        )
+        
         report = {
             'timestamp': datetime.now().isoformat(),
             'input_hash': input_hash,
             'consistency_check': consistency_result,
             'output_summary': {
                 'total_stories': len(output_stories),
-                'categories': {},
-                'priorities': {},
+                'categories': dict(Counter(s.get('Category', 'Unknown') for s in output_stories)),
+                'priorities': dict(Counter(s.get('Priority', 'Unknown') for s in output_stories)),
                 'score_distribution': {
-                    'high': len([s for s in output_stories if s.get('Match Score', 0) >= 0.8]),
-                    'medium': len([s for s in output_stories if 0.5 <= s.get('Match Score', 0) < 0.8]),
-                    'low': len([s for s in output_stories if s.get('Match Score', 0) < 0.5])
+                    'high': scores['high'],
+                    'medium': scores['medium'],
+                    'low': scores['low']
                 }
             },
             'recommendations': []
         }
         
-        # Add category and priority distributions
-        for story in output_stories:
-            category = story.get('Category', 'Unknown')
-            priority = story.get('Priority', 'Unknown')
-            
-            report['output_summary']['categories'][category] = report['output_summary']['categories'].get(category, 0) + 1
-            report['output_summary']['priorities'][priority] = report['output_summary']['priorities'].get(priority, 0) + 1
-        
         # Add recommendations based on consistency results
         if not consistency_result['is_consistent']:
             if consistency_result['consistency_score'] < 0.5:
@@ -321,7 +323,7 @@ class ConsistencyChecker:
                 
                 if (current_time - file_time).days > max_age_days:
                     os.remove(file_path)
-                    print(f"Removed old cache file: {filename}")
+                    logger.info(f"🧹 Removed old cache file: {filename}")
     
     def get_cache_stats(self) -> Dict[str, Any]:
         """Get statistics about the consistency cache"""
@@ -1,10 +1,62 @@
+import os
 import re
-import hashlib
-from typing import List, Dict, Any, Tuple
+import math
+import asyncio
+import threading
+import multiprocessing
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from difflib import SequenceMatcher
 import numpy as np
+import xxhash
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Scoring inputs shared by every story in _calculate_final_scores
+BENEFIT_PATTERN = re.compile(r'so that (.+)')
+REQUIRED_FIELDS = ('User Story', 'Capability', 'Category', 'Priority')
+OPTIONAL_FIELDS = ('Snippet', 'Tags', 'requirements', 'acceptance_criteria')
+
+# Text normalization for comparison in _normalize_text
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+FILLER_WORDS = frozenset(['the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'])
+
+# Weights of the pairwise similarity components in _are_stories_similar
+TEXT_SIMILARITY_WEIGHT = 0.4
+CAPABILITY_SIMILARITY_WEIGHT = 0.4
+SEMANTIC_SIMILARITY_WEIGHT = 0.2
+
+# Pair verification switches to a process pool above this many candidate pairs
+PARALLEL_PAIR_THRESHOLD = 20000
+PAIR_CHUNK_SIZE = 1024
+
+# One pool per process, created on first use. The worker is multi-threaded (Pub/Sub, gRPC, the inference
+# loop), so children come from forkserver/spawn rather than a fork of this process.
+_pair_pool: Optional[ProcessPoolExecutor] = None
+_pair_pool_lock = threading.Lock()
+
+def _get_pair_pool() -> ProcessPoolExecutor:
+    """Return the shared pair verification pool, creating it on first use"""
+    global _pair_pool
+    
+    with _pair_pool_lock:
+        if _pair_pool is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pair_pool = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context(start_method))
+        return _pair_pool
+
+def _verify_pair_batch(similarity_threshold: float, pairs: List[Tuple[int, int]], features: Dict[int, Dict[str, Any]], tfidf_matrix) -> List[Tuple[int, int]]:
+    """Return the pairs from the chunk whose stories meet the similarity threshold
+
+    Receives only the features and TF-IDF rows of the stories in this chunk, with 'tfidf_row' pointing into tfidf_matrix.
+    """
+    engine = DeduplicationEngine(similarity_threshold)
+    engine._tfidf_matrix = tfidf_matrix
+    return [(i, j) for i, j in pairs if engine._are_stories_similar(features[i], features[j])]
 
 class DeduplicationEngine:
     """Deduplication engine using Jaccard similarity and semantic analysis with deterministic processing"""
@@ -18,23 +70,39 @@ class DeduplicationEngine:
             max_features=1000,
             random_state=42  # Fixed seed for consistency
         )
+        # TF-IDF matrix for the current batch; row i belongs to the features with 'tfidf_row' == i
+        self._tfidf_matrix = None
     
     async def deduplicate_and_score(self, stories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Deduplicate stories and assign confidence scores with deterministic processing"""
+        """Deduplicate stories and assign confidence scores with deterministic processing
+
+        The final ``Match Score`` is written onto the caller's story dicts rather than
+        copies; normalized comparison fields are kept in a separate per-story list and
+        never added to the stories.
+        """
         if not stories:
             return []
         
         # Sort stories by ID for consistent processing order
         sorted_stories = sorted(stories, key=lambda x: x.get('User Story ID', ''))
         
-        # Clean and normalize stories
-        cleaned_stories = self._clean_stories(sorted_stories)
+        # Clean and normalize stories; features[i] describes sorted_stories[i]
+        features = self._clean_stories(sorted_stories)
+        
+        # Fit the vectorizer once on the whole batch instead of once per pair
+        self._fit_semantic_vectors(features)
+        
+        # Only pairs that can reach the threshold are compared; large candidate sets are verified on the process pool
+        candidate_pairs = self._candidate_pairs(features)
+        similar_pairs = None
+        if len(candidate_pairs) >= PARALLEL_PAIR_THRESHOLD:
+            similar_pairs = await self._verify_pairs_parallel(features, candidate_pairs)
         
         # Find duplicates using deterministic algorithm
-        duplicate_groups = self._find_duplicates(cleaned_stories)
+        duplicate_groups = self._find_duplicates(features, candidate_pairs, similar_pairs)
         
         # Merge duplicates with consistent strategy
-        merged_stories = self._merge_duplicates(cleaned_stories, duplicate_groups)
+        merged_stories = self._merge_duplicates(sorted_stories, duplicate_groups)
         
         # Calculate final scores with deterministic logic
         scored_stories = self._calculate_final_scores(merged_stories)
@@ -45,27 +113,20 @@ class DeduplicationEngine:
         return scored_stories
     
     def _clean_stories(self, stories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Clean and normalize story text with consistent processing"""
-        cleaned = []
+        """Build normalized comparison features for each story, in story order, without touching the stories"""
+        features = []
         
         for story in stories:
-            cleaned_story = story.copy()
-            
-            # Clean user story text
-            if 'User Story' in cleaned_story:
-                cleaned_story['clean_text'] = self._normalize_text(cleaned_story['User Story'])
-            
-            # Clean capability text
-            if 'Capability' in cleaned_story:
-                cleaned_story['clean_capability'] = self._normalize_text(cleaned_story['Capability'])
-            
-            # Clean snippet text
-            if 'Snippet' in cleaned_story:
-                cleaned_story['clean_snippet'] = self._normalize_text(cleaned_story['Snippet'])
-            
-            cleaned.append(cleaned_story)
-        
-        return cleaned
+            # Clean user story, capability and snippet text
+            clean_text = self._normalize_text(story.get('User Story', ''))
+            features.append({
+                'clean_text': clean_text,
+                'clean_tokens': frozenset(clean_text.split()),
+                'clean_capability': self._normalize_text(story.get('Capability', '')),
+                'clean_snippet': self._normalize_text(story.get('Snippet', ''))
+            })
+        
+        return features
     
     def _normalize_text(self, text: str) -> str:
         """Normalize text for comparison with consistent logic"""
@@ -76,23 +137,71 @@ class DeduplicationEngine:
         text = text.lower()
         
         # Remove punctuation
-        text = re.sub(r'[^\w\s]', ' ', text)
-        
-        # Remove extra whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = PUNCTUATION_PATTERN.sub(' ', text)
         
-        # Remove common filler words
-        filler_words = ['the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by']
-        words = text.split()
-        words = [word for word in words if word not in filler_words]
+        # Remove common filler words; split() also collapses extra whitespace
+        words = [word for word in text.split() if word not in FILLER_WORDS]
         
         return ' '.join(words)
     
-    def _find_duplicates(self, stories: List[Dict[str, Any]]) -> List[List[int]]:
-        """Find groups of duplicate stories using deterministic algorithm"""
+    def _semantic_text(self, story: Dict[str, Any]) -> str:
+        """Combine the normalized fields used for semantic comparison"""
+        return f"{story.get('clean_text', '')} {story.get('clean_capability', '')}"
+    
+    def _fit_semantic_vectors(self, stories: List[Dict[str, Any]]) -> None:
+        """Fit TF-IDF once over the batch and tag each story's features with its matrix row"""
+        self._tfidf_matrix = None
+        corpus = []
+        for story_features in stories:
+            story_features['tfidf_row'] = len(corpus)
+            corpus.append(self._semantic_text(story_features))
+        
+        try:
+            self._tfidf_matrix = self.vectorizer.fit_transform(corpus)
+        except ValueError as e:
+            # Empty vocabulary (e.g. only stop words) - semantic similarity falls back to 0.0
+            logger.warning(f"⚠️ Error fitting semantic vectorizer: {e}")
+    
+    def _candidate_pairs(self, stories: List[Dict[str, Any]]) -> List[Tuple[int, int]]:
+        """Sorted (i, j) pairs, i < j, that can reach the similarity threshold
+
+        Capability and semantic similarity contribute at most their weights, so a similar pair needs a minimum
+        token Jaccard similarity. Prefix filtering finds exactly the pairs that can meet it: with tokens ordered
+        rarest first, two sets with Jaccard >= t must share a token within their first |s| - ceil(t * |s|) + 1.
+        """
+        count = len(stories)
+        max_without_text = CAPABILITY_SIMILARITY_WEIGHT + SEMANTIC_SIMILARITY_WEIGHT
+        # Small slack keeps float rounding in the other similarities from excluding a borderline pair
+        min_jaccard = (self.similarity_threshold - max_without_text) / TEXT_SIMILARITY_WEIGHT - 1e-6
+        if min_jaccard <= 0:
+            return [(i, j) for i in range(count) for j in range(i + 1, count)]
+        
+        token_frequency = Counter(token for story in stories for token in story['clean_tokens'])
+        stories_by_prefix_token = defaultdict(list)
+        pairs = set()
+        for j, story in enumerate(stories):
+            tokens = sorted(story['clean_tokens'], key=lambda token: (token_frequency[token], token))
+            prefix_length = len(tokens) - math.ceil(min_jaccard * len(tokens)) + 1
+            for token in tokens[:prefix_length]:
+                for i in stories_by_prefix_token[token]:
+                    pairs.add((i, j))
+                stories_by_prefix_token[token].append(j)
+        
+        return sorted(pairs)
+    
+    def _find_duplicates(self, stories: List[Dict[str, Any]], candidate_pairs: List[Tuple[int, int]], similar_pairs: Optional[set] = None) -> List[List[int]]:
+        """Find groups of duplicate stories using deterministic algorithm
+
+        Only candidate pairs are compared; similar_pairs, when given, holds the candidates already verified as similar.
+        """
         duplicate_groups = []
         processed = set()
         
+        # Candidates per story in ascending order, so each story is compared with later ones in order
+        candidates_by_story = defaultdict(list)
+        for i, j in candidate_pairs:
+            candidates_by_story[i].append(j)
+        
         # Process stories in sorted order for consistency
         for i, story in enumerate(stories):
             if i in processed:
@@ -101,12 +210,17 @@ class DeduplicationEngine:
             current_group = [i]
             processed.add(i)
             
-            # Compare with remaining stories in order
-            for j, other_story in enumerate(stories[i+1:], i+1):
+            # Compare with remaining candidate stories in order
+            for j in candidates_by_story.get(i, ()):
                 if j in processed:
                     continue
                 
-                if self._are_stories_similar(story, other_story):
+                if similar_pairs is not None:
+                    is_similar = (i, j) in similar_pairs
+                else:
+                    is_similar = self._are_stories_similar(story, stories[j])
+                
+                if is_similar:
                     current_group.append(j)
                     processed.add(j)
             
@@ -119,6 +233,25 @@ class DeduplicationEngine:
         duplicate_groups.sort(key=lambda x: x[0])
         return duplicate_groups
     
+    async def _verify_pairs_parallel(self, stories: List[Dict[str, Any]], pairs: List[Tuple[int, int]]) -> set:
+        """Verify candidate pairs on the shared process pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        pool = _get_pair_pool()
+        
+        tasks = []
+        for start in range(0, len(pairs), PAIR_CHUNK_SIZE):
+            chunk = pairs[start:start + PAIR_CHUNK_SIZE]
+            # Ship only this chunk's stories and TF-IDF rows, re-pointing tfidf_row into the sliced matrix
+            indices = sorted({index for pair in chunk for index in pair})
+            chunk_features = {index: {**stories[index], 'tfidf_row': row} for row, index in enumerate(indices)}
+            chunk_matrix = self._tfidf_matrix[indices] if self._tfidf_matrix is not None else None
+            tasks.append(loop.run_in_executor(pool, _verify_pair_batch, self.similarity_threshold, chunk, chunk_features, chunk_matrix))
+        
+        similar_pairs = set()
+        for chunk_result in await asyncio.gather(*tasks):
+            similar_pairs.update(chunk_result)
+        return similar_pairs
+    
     def _are_stories_similar(self, story1: Dict[str, Any], story2: Dict[str, Any]) -> bool:
         """Check if two stories are similar using deterministic similarity calculation"""
         # Calculate multiple similarity scores
@@ -128,29 +261,24 @@ class DeduplicationEngine:
         
         # Weighted average of similarities with fixed weights
         weighted_similarity = (
-            text_similarity * 0.4 +
-            capability_similarity * 0.4 +
-            semantic_similarity * 0.2
+            text_similarity * TEXT_SIMILARITY_WEIGHT +
+            capability_similarity * CAPABILITY_SIMILARITY_WEIGHT +
+            semantic_similarity * SEMANTIC_SIMILARITY_WEIGHT
         )
         
         return weighted_similarity >= self.similarity_threshold
     
     def _calculate_text_similarity(self, story1: Dict[str, Any], story2: Dict[str, Any]) -> float:
         """Calculate text similarity using Jaccard distance with consistent logic"""
-        text1 = story1.get('clean_text', '')
-        text2 = story2.get('clean_text', '')
-        
-        if not text1 or not text2:
-            return 0.0
-        
-        words1 = set(text1.split())
-        words2 = set(text2.split())
+        # Token sets are built once per story in _clean_stories
+        words1 = story1.get('clean_tokens')
+        words2 = story2.get('clean_tokens')
         
         if not words1 or not words2:
             return 0.0
         
-        intersection = len(words1.intersection(words2))
-        union = len(words1.union(words2))
+        intersection = len(words1 & words2)
+        union = len(words1 | words2)
         
         return intersection / union if union > 0 else 0.0
     
@@ -167,28 +295,28 @@ class DeduplicationEngine:
     def _calculate_semantic_similarity(self, story1: Dict[str, Any], story2: Dict[str, Any]) -> float:
         """Calculate semantic similarity using TF-IDF and cosine similarity with deterministic processing"""
         try:
-            # Combine relevant text fields
-            text1 = f"{story1.get('clean_text', '')} {story1.get('clean_capability', '')}"
-            text2 = f"{story2.get('clean_text', '')} {story2.get('clean_capability', '')}"
+            if self._tfidf_matrix is None:
+                return 0.0
             
-            if not text1.strip() or not text2.strip():
+            # Combine relevant text fields
+            if not self._semantic_text(story1).strip() or not self._semantic_text(story2).strip():
                 return 0.0
             
-            # Vectorize texts with fixed random state
-            texts = [text1, text2]
-            tfidf_matrix = self.vectorizer.fit_transform(texts)
+            # Look up the rows vectorized once for the whole batch
+            row1 = story1['tfidf_row']
+            row2 = story2['tfidf_row']
             
             # Calculate cosine similarity
-            similarity_matrix = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])
+            similarity_matrix = cosine_similarity(self._tfidf_matrix[row1:row1 + 1], self._tfidf_matrix[row2:row2 + 1])
             
             return float(similarity_matrix[0][0])
         except Exception as e:
-            print(f"Error calculating semantic similarity: {str(e)}")
+            logger.warning(f"⚠️ Error calculating semantic similarity: {e}")
             return 0.0
     
     def _merge_duplicates(self, stories: List[Dict[str, Any]], duplicate_groups: List[List[int]]) -> List[Dict[str, Any]]:
         """Merge duplicate stories into single, enhanced stories with consistent strategy"""
-        merged_stories = []
+        group_merges = []
         merged_indices = set()
         
         # Process duplicate groups in order
@@ -198,18 +326,15 @@ class DeduplicationEngine:
             
             # Merge stories in the group using consistent strategy
             merged_story = self._merge_story_group([stories[i] for i in group])
-            merged_stories.append(merged_story)
+            group_merges.append(merged_story)
             
             # Mark indices as merged
             merged_indices.update(group)
         
-        # Add non-duplicate stories in order
-        for i, story in enumerate(stories):
-            if i not in merged_indices:
-                merged_stories.append(story)
-        
-        # Sort by original index for consistency
-        merged_stories.sort(key=lambda x: stories.index(x) if x in stories else 999999)
+        # Non-duplicate stories keep their original order, followed by merged stories in group order;
+        # built directly rather than sorting on a linear stories.index() lookup per story
+        merged_stories = [story for i, story in enumerate(stories) if i not in merged_indices]
+        merged_stories.extend(group_merges)
         return merged_stories
     
     def _merge_story_group(self, story_group: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -265,7 +390,7 @@ class DeduplicationEngine:
         # Create a deterministic string from all story IDs
         story_ids = sorted([s.get('User Story ID', '') for s in story_group])
         merge_string = "|".join(story_ids)
-        return hashlib.md5(merge_string.encode()).hexdigest()
+        return xxhash.xxh3_128_hexdigest(merge_string)
     
     def _merge_text_fields(self, texts: List[str]) -> str:
         """Merge multiple text fields intelligently with consistent logic"""
@@ -302,75 +427,57 @@ class DeduplicationEngine:
         return merged_text
     
     def _calculate_final_scores(self, stories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Calculate final confidence scores for stories with deterministic logic"""
-        scored_stories = []
+        """Calculate final confidence scores for stories with deterministic logic
+
+        Quality and completeness components are computed in a single pass per story
+        and the weighted combination is applied to the whole batch at once.
+        """
+        if not stories:
+            return []
         
-        for story in stories:
-            scored_story = story.copy()
-            
-            # Base score from extraction
-            base_score = story.get('Match Score', 0.5)
-            
-            # Quality adjustments with consistent logic
-            quality_score = self._calculate_quality_score(story)
-            
-            # Completeness adjustments with consistent logic
-            completeness_score = self._calculate_completeness_score(story)
+        count = len(stories)
+        base_scores = np.empty(count)
+        quality_scores = np.empty(count)
+        completeness_scores = np.empty(count)
+        
+        for idx, story in enumerate(stories):
+            base_scores[idx] = story.get('Match Score', 0.5)
             
-            # Final weighted score with consistent rounding
-            final_score = (
-                base_score * 0.5 +
-                quality_score * 0.3 +
-                completeness_score * 0.2
-            )
+            # Quality: proper format, detailed capability, clear benefit, tags
+            story_lower = story.get('User Story', '').lower()
+            quality = 0.5
+            if 'as a' in story_lower and 'i need' in story_lower and 'so that' in story_lower:
+                quality += 0.2
+            if len(story.get('Capability', '')) > 20:
+                quality += 0.1
+            benefit_match = BENEFIT_PATTERN.search(story_lower)
+            if benefit_match and len(benefit_match.group(1)) > 10:
+                quality += 0.1
+            if story.get('Tags') and len(story['Tags']) > 1:
+                quality += 0.1
+            quality_scores[idx] = quality
             
-            scored_story['Match Score'] = round(final_score, 3)
-            scored_stories.append(scored_story)
+            # Completeness: required and optional fields present
+            completeness = 0.5
+            for field in REQUIRED_FIELDS:
+                if story.get(field):
+                    completeness += 0.1
+            for field in OPTIONAL_FIELDS:
+                if story.get(field):
+                    completeness += 0.05
+            completeness_scores[idx] = completeness
+        
+        # Final weighted score over the whole batch
+        final_scores = (
+            base_scores * 0.5 +
+            np.minimum(quality_scores, 1.0) * 0.3 +
+            np.minimum(completeness_scores, 1.0) * 0.2
+        )
         
-        return scored_stories
-    
-    def _calculate_quality_score(self, story: Dict[str, Any]) -> float:
-        """Calculate quality score based on story characteristics with consistent logic"""
-        score = 0.5  # Base score
-        
-        # Check for proper user story format
-        user_story = story.get('User Story', '')
-        if 'as a' in user_story.lower() and 'i need' in user_story.lower() and 'so that' in user_story.lower():
-            score += 0.2
-        
-        # Check for detailed capability
-        capability = story.get('Capability', '')
-        if len(capability) > 20:
-            score += 0.1
-        
-        # Check for clear benefit
-        benefit_match = re.search(r'so that (.+)', user_story.lower())
-        if benefit_match and len(benefit_match.group(1)) > 10:
-            score += 0.1
-        
-        # Check for tags
-        if story.get('Tags') and len(story['Tags']) > 1:
-            score += 0.1
-        
-        return min(score, 1.0)
-    
-    def _calculate_completeness_score(self, story: Dict[str, Any]) -> float:
-        """Calculate completeness score with consistent logic"""
-        score = 0.5  # Base score
-        
-        # Check required fields
-        required_fields = ['User Story', 'Capability', 'Category', 'Priority']
-        for field in required_fields:
-            if story.get(field):
-                score += 0.1
-        
-        # Check optional fields
-        optional_fields = ['Snippet', 'Tags', 'requirements', 'acceptance_criteria']
-        for field in optional_fields:
-            if story.get(field):
-                score += 0.05
-        
-        return min(score, 1.0)
+        for story, final_score in zip(stories, final_scores.tolist()):
+            story['Match Score'] = round(final_score, 3)
+        
+        return stories
     
     def get_deduplication_summary(self, original_count: int, final_count: int, duplicate_groups: List[List[int]]) -> Dict[str, Any]:
         """Generate deduplication summary with consistent metrics"""
@@ -394,4 +501,4 @@ class DeduplicationEngine:
             group_strings.append("|".join(map(str, sorted(group))))
         
         summary_string = f"{original_count}:{final_count}:{':'.join(group_strings)}"
-        return hashlib.md5(summary_string.encode()).hexdigest()
+        return xxhash.xxh3_128_hexdigest(summary_string)
@@ -1,10 +1,51 @@
 import os
 import re
+from collections import Counter
 from typing import List, Dict, Any
+import ahocorasick
 import docx
 import PyPDF2
 import markdown
 from io import BytesIO
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Paragraph separator: blank line, optionally containing whitespace
+PARAGRAPH_SPLIT_PATTERN = re.compile(r'\n\s*\n')
+
+# Markup left over after rendering Markdown to HTML
+HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+
+# Speaker label formats, tried in order
+SPEAKER_PATTERNS = [
+    re.compile(r'^([A-Z][a-z]+):\s*(.+)$'),  # Speaker: content
+    re.compile(r'^([A-Z][A-Z\s]+):\s*(.+)$'),  # SPEAKER: content
+    re.compile(r'^([A-Z][a-z]+\s+[A-Z][a-z]+):\s*(.+)$'),  # Full Name: content
+]
+
+WORKFLOW_KEYWORDS = [
+    'workflow', 'process', 'approval', 'review', 'sign-off',
+    'routing', 'escalation', 'notification', 'automation',
+    'business rules', 'decision points', 'status', 'state'
+]
+
+DAM_KEYWORDS = [
+    'digital asset', 'asset management', 'metadata', 'tagging',
+    'version control', 'access control', 'permissions', 'search',
+    'categorization', 'workflow integration'
+]
+
+def _build_keyword_automaton(keywords: List[str]) -> ahocorasick.Automaton:
+    """Aho-Corasick automaton yielding each matched keyword; finds every substring match in one pass"""
+    automaton = ahocorasick.Automaton()
+    for keyword in keywords:
+        automaton.add_word(keyword, keyword)
+    automaton.make_automaton()
+    return automaton
+
+# One pass per paragraph covers both keyword lists, matching substrings like the `in` checks it replaces
+CONTENT_KEYWORD_AUTOMATON = _build_keyword_automaton(WORKFLOW_KEYWORDS + DAM_KEYWORDS)
 
 class DocumentProcessor:
     """Processes different document formats and extracts structured text"""
@@ -23,16 +64,19 @@ class DocumentProcessor:
                 file_type = doc.get('file_type', 'txt')
                 
                 if content:
+                    # Split once; workflow analysis scans the same paragraphs
+                    paragraphs = self._extract_paragraphs(content)
                     processed_docs.append({
                         'filename': doc['filename'],
                         'file_type': file_type,
                         'content': content,
-                        'paragraphs': self._extract_paragraphs(content),
+                        'size': doc.get('size', len(content)),
+                        'paragraphs': paragraphs,
                         'speaker_labels': self._extract_speaker_labels(content),
-                        'workflow_analysis': self._identify_workflow_content(content)
+                        'workflow_analysis': self._identify_workflow_content(paragraphs)
                     })
             except Exception as e:
-                print(f"Error processing {doc['filename']}: {str(e)}")
+                logger.error(f"❌ Error processing {doc['filename']}: {e}")
                 continue
         
         return processed_docs
@@ -65,7 +109,7 @@ class DocumentProcessor:
             # Fallback to utf-8 with errors='ignore'
             return content.decode('utf-8', errors='ignore')
         except Exception as e:
-            print(f"Error processing TXT file: {str(e)}")
+            logger.error(f"❌ Error processing TXT file: {e}")
             return ""
     
     def _process_docx(self, content: bytes) -> str:
@@ -80,7 +124,7 @@ class DocumentProcessor:
             
             return '\n\n'.join(text_parts)
         except Exception as e:
-            print(f"Error processing DOCX file: {str(e)}")
+            logger.error(f"❌ Error processing DOCX file: {e}")
             return ""
     
     def _process_markdown(self, content: bytes) -> str:
@@ -90,10 +134,10 @@ class DocumentProcessor:
             # Convert markdown to plain text
             html = markdown.markdown(text)
             # Remove HTML tags
-            clean_text = re.sub(r'<[^>]+>', '', html)
+            clean_text = HTML_TAG_PATTERN.sub('', html)
             return clean_text
         except Exception as e:
-            print(f"Error processing Markdown file: {str(e)}")
+            logger.error(f"❌ Error processing Markdown file: {e}")
             return ""
     
     def _process_pdf(self, content: bytes) -> str:
@@ -110,36 +154,23 @@ class DocumentProcessor:
             
             return '\n\n'.join(text_parts)
         except Exception as e:
-            print(f"Error processing PDF file: {str(e)}")
+            logger.error(f"❌ Error processing PDF file: {e}")
             return ""
     
     def _extract_paragraphs(self, text: str) -> List[str]:
         """Extract paragraphs from processed text"""
-        # Split by double newlines or common paragraph separators
-        paragraphs = re.split(r'\n\s*\n', text)
-        # Clean and filter paragraphs
-        cleaned_paragraphs = []
-        for para in paragraphs:
-            para = para.strip()
-            if para and len(para) > 10:  # Filter out very short paragraphs
-                cleaned_paragraphs.append(para)
-        return cleaned_paragraphs
+        # Split by double newlines or common paragraph separators, filtering out very short paragraphs
+        return [para for para in map(str.strip, PARAGRAPH_SPLIT_PATTERN.split(text)) if len(para) > 10]
     
     def _extract_speaker_labels(self, text: str) -> List[Dict[str, str]]:
         """Extract speaker labels and their content"""
-        speaker_patterns = [
-            r'^([A-Z][a-z]+):\s*(.+)$',  # Speaker: content
-            r'^([A-Z][A-Z\s]+):\s*(.+)$',  # SPEAKER: content
-            r'^([A-Z][a-z]+\s+[A-Z][a-z]+):\s*(.+)$',  # Full Name: content
-        ]
-        
         speakers = []
         lines = text.split('\n')
         
         for line in lines:
             line = line.strip()
-            for pattern in speaker_patterns:
-                match = re.match(pattern, line)
+            for pattern in SPEAKER_PATTERNS:
+                match = pattern.match(line)
                 if match:
                     speaker = match.group(1).strip()
                     content = match.group(2).strip()
@@ -153,42 +184,32 @@ class DocumentProcessor:
         
         return speakers
     
-    def _identify_workflow_content(self, text: str) -> Dict[str, Any]:
-        """Identify workflow-related content in the text"""
-        workflow_keywords = [
-            'workflow', 'process', 'approval', 'review', 'sign-off',
-            'routing', 'escalation', 'notification', 'automation',
-            'business rules', 'decision points', 'status', 'state'
-        ]
-        
-        dam_keywords = [
-            'digital asset', 'asset management', 'metadata', 'tagging',
-            'version control', 'access control', 'permissions', 'search',
-            'categorization', 'workflow integration'
-        ]
-        
+    def _identify_workflow_content(self, paragraphs: List[str]) -> Dict[str, Any]:
+        """Identify workflow-related content in the document's paragraphs"""
         workflow_matches = []
         dam_matches = []
         
-        paragraphs = self._extract_paragraphs(text)
-        
         for i, para in enumerate(paragraphs):
-            para_lower = para.lower()
+            found = {keyword for _, keyword in CONTENT_KEYWORD_AUTOMATON.iter(para.lower())}
+            if not found:
+                continue
             
             # Check for workflow content
-            if any(keyword in para_lower for keyword in workflow_keywords):
+            keywords = [kw for kw in WORKFLOW_KEYWORDS if kw in found]
+            if keywords:
                 workflow_matches.append({
                     'paragraph_index': i,
                     'content': para,
-                    'keywords': [kw for kw in workflow_keywords if kw in para_lower]
+                    'keywords': keywords
                 })
             
             # Check for DAM content
-            if any(keyword in para_lower for keyword in dam_keywords):
+            keywords = [kw for kw in DAM_KEYWORDS if kw in found]
+            if keywords:
                 dam_matches.append({
                     'paragraph_index': i,
                     'content': para,
-                    'keywords': [kw for kw in dam_keywords if kw in para_lower]
+                    'keywords': keywords
                 })
         
         return {
@@ -205,15 +226,12 @@ class DocumentProcessor:
         total_paragraphs = sum(len(doc.get('paragraphs', [])) for doc in documents)
         total_speakers = sum(len(doc.get('speaker_labels', [])) for doc in documents)
         
-        file_types = {}
-        for doc in documents:
-            file_type = doc.get('file_type', 'unknown')
-            file_types[file_type] = file_types.get(file_type, 0) + 1
+        file_types = Counter(doc.get('file_type', 'unknown') for doc in documents)
         
         return {
             'total_files': total_files,
             'total_paragraphs': total_paragraphs,
             'total_speakers': total_speakers,
-            'file_type_distribution': file_types,
+            'file_type_distribution': dict(file_types),
             'processing_status': 'completed'
         }
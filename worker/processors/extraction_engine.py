@@ -1,47 +1,443 @@
 import re
-import json
 import hashlib
 import os
-from typing import List, Dict, Any, Optional
+import asyncio
+import pickle
+import time
+import threading
+import itertools
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+import orjson
+import xxhash
+import ahocorasick
+import httpx
 from google.generativeai import GenerativeModel
 import openai
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from .semantic_index import SemanticIndex
 import logging
 
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # Optional: without it the response cache only serves exact matches
+    SentenceTransformer = None
+
+try:
+    from google import genai as google_genai
+except ImportError:  # Optional: only the gemini_batch provider needs the google-genai SDK
+    google_genai = None
+
 logger = logging.getLogger(__name__)
 
+# Semantic response cache: paragraphs at least this similar reuse a cached extraction
+SEMANTIC_CACHE_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+SEMANTIC_CACHE_THRESHOLD = 0.92
+# Bump when the cached story format changes so older entries stop matching
+EXTRACTION_CACHE_VERSION = 1
+# Persisted extractions older than this are treated as misses and regenerated
+EXTRACTION_CACHE_TTL_SECONDS = 30 * 86400
+# In-memory entries kept per engine; the oldest are dropped in bulk once the cap is exceeded, and the
+# semantic index overwrites its oldest embeddings beyond the same cap
+RESPONSE_CACHE_MAX_ENTRIES = 10000
+RESPONSE_CACHE_EVICT_TO = 9000
+
+GEMINI_MODEL = 'gemini-pro'
+# Gemini Batch Mode only serves current models, so offline runs use their own model
+GEMINI_BATCH_MODEL = 'gemini-2.5-flash'
+OPENAI_MODEL = "gpt-4o-mini"
+# Output budget per extracted story (~P95 of a story object); batched calls scale it by batch size
+STORY_OUTPUT_TOKENS = 300
+
+# Default request budget per provider (requests per minute); ExtractionEngine(requests_per_minute=...) overrides it
+PROVIDER_REQUESTS_PER_MINUTE = {'gemini': 60, 'openai': 500}
+# Rate-limit rejections are retried with exponential backoff starting at LLM_RETRY_BASE_DELAY seconds
+RATE_LIMIT_ERRORS = (google_exceptions.ResourceExhausted, openai.RateLimitError)
+LLM_MAX_RETRIES = 3
+LLM_RETRY_BASE_DELAY = 1.0
+
+# Without an LLM, runs with at least this many unique paragraphs pattern-extract across a process pool
+PATTERN_PARALLEL_THRESHOLD = 5000
+PATTERN_CHUNK_SIZE = 32
+
+# Optional local paragraph classifier: paragraphs scoring below this are not sent to the LLM
+STORY_CLASSIFIER_THRESHOLD = 0.3
+
+# Offline Batch API runs (OpenAI Batch API, Gemini Batch Mode) are polled at this interval until they finish
+BATCH_API_PROVIDERS = ('openai_batch', 'gemini_batch')
+BATCH_POLL_INTERVAL_SECONDS = 30
+BATCH_TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+GEMINI_BATCH_TERMINAL_STATES = (
+    'JOB_STATE_SUCCEEDED', 'JOB_STATE_PARTIALLY_SUCCEEDED', 'JOB_STATE_FAILED', 'JOB_STATE_CANCELLED', 'JOB_STATE_EXPIRED'
+)
+
+# Keyword scanning, compiled once at import
+WORKFLOW_KEYWORDS = (
+    'workflow', 'process', 'approval', 'review', 'sign-off',
+    'routing', 'escalation', 'notification', 'automation',
+    'business rules', 'decision points', 'status', 'state',
+    'escalate', 'route', 'approve', 'reject', 'notify'
+)
+DAM_KEYWORDS = (
+    'digital asset', 'asset management', 'metadata', 'tagging',
+    'version control', 'access control', 'permissions', 'search',
+    'categorization', 'workflow integration', 'asset', 'file',
+    'upload', 'download', 'share', 'collaborate'
+)
+WORKFLOW_CATEGORY_KEYWORDS = ('workflow', 'process', 'approval')
+DAM_CATEGORY_KEYWORDS = ('asset', 'digital', 'metadata')
+CAPABILITY_KEYWORDS = ('need', 'want', 'should', 'must', 'require')
+ROLE_PATTERN = re.compile(r'as a (\w+)')
+# Paragraphs that already state a full "As a X, I need Y so that Z" story skip the LLM
+DIRECT_STORY_PATTERN = re.compile(
+    r'as an?\s+(?P<role>[^,]+?),\s+I\s+(?:need|want)\s+(?P<capability>.+?)\s+so\s+that\s+(?P<benefit>.+?)(?:[.\n]|$)',
+    re.IGNORECASE
+)
+# Synonym -> canonical term for _normalize_text; one alternation replaces four sequential re.sub passes
+NORMALIZED_TERMS = {
+    'workflow': 'workflow', 'process': 'workflow', 'procedure': 'workflow',
+    'asset': 'asset', 'file': 'asset', 'document': 'asset', 'media': 'asset',
+    'approve': 'approval', 'approval': 'approval', 'sign-off': 'approval', 'signoff': 'approval',
+    'notify': 'notification', 'notification': 'notification', 'alert': 'notification', 'email': 'notification'
+}
+NORMALIZED_TERMS_PATTERN = re.compile(r'\b(' + '|'.join(re.escape(term) for term in NORMALIZED_TERMS) + r')\b')
+# Capability keyword -> tag; matched as substrings like the original `in` checks
+CAPABILITY_TAGS = {
+    'approval': 'approval',
+    'notification': 'notification',
+    'routing': 'routing',
+    'asset': 'asset-management'
+}
+
+
+def _build_keyword_automaton(keyword_values: Dict[str, str]) -> ahocorasick.Automaton:
+    """Aho-Corasick automaton yielding each keyword's value; finds every substring match in one pass"""
+    automaton = ahocorasick.Automaton()
+    for keyword, value in keyword_values.items():
+        automaton.add_word(keyword, value)
+    automaton.make_automaton()
+    return automaton
+
+
+# Keyword scans run over lowercased text, matching substrings like the `in` checks they replace
+RELEVANT_CONTENT_AUTOMATON = _build_keyword_automaton({keyword: keyword for keyword in WORKFLOW_KEYWORDS + DAM_KEYWORDS})
+CATEGORY_AUTOMATON = _build_keyword_automaton({
+    **{keyword: 'dam' for keyword in DAM_CATEGORY_KEYWORDS},
+    **{keyword: 'workflow' for keyword in WORKFLOW_CATEGORY_KEYWORDS}
+})
+CAPABILITY_TAG_AUTOMATON = _build_keyword_automaton(CAPABILITY_TAGS)
+
+# Characters that can change bracket depth or string state while scanning JSON
+JSON_STRUCTURAL_PATTERN = re.compile(r'[\[\]{}"\\]')
+
+# Appended after the context chunks in context-enriched prompts
+CONTEXT_USAGE_INSTRUCTION = "\nUse this context to provide more accurate and detailed extraction. Consider the relationships between different parts of the interviews and how they inform the user story."
+
+# Stakeholder is the last field of the context prompt's output format; once its line ends the story is complete
+CONTEXT_STORY_END_PATTERN = re.compile(r'^\s*Stakeholder:.*\n', re.MULTILINE)
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count for batch sizing (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+def _decode_outer_json_span(text: str, opener: str, closer: str) -> Any:
+    """Fast path: decode the span from the first opener to the last closer with orjson, or None"""
+    start = text.find(opener)
+    end = text.rfind(closer)
+    if start == -1 or end < start:
+        return None
+    try:
+        return orjson.loads(text[start:end + 1])
+    except orjson.JSONDecodeError:
+        return None
+
+def _find_json_span_end(text: str, start: int) -> int:
+    """Index of the bracket closing the one at text[start], or -1 if it never closes
+
+    One linear pass over the structural characters, honouring string literals and escapes.
+    """
+    depth = 0
+    in_string = False
+    escaped_index = -1
+    for match in JSON_STRUCTURAL_PATTERN.finditer(text, start):
+        position = match.start()
+        char = match.group()
+        if in_string:
+            if position == escaped_index:
+                continue
+            if char == '\\':
+                escaped_index = position + 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '[{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return position
+    return -1
+
+def _decode_first_balanced_json(text: str, opener: str, accept) -> Any:
+    """Slow path: decode each balanced span starting at an opener until one satisfies accept"""
+    start = text.find(opener)
+    while start != -1:
+        end = _find_json_span_end(text, start)
+        if end != -1:
+            try:
+                value = orjson.loads(text[start:end + 1])
+                if accept(value):
+                    return value
+            except orjson.JSONDecodeError:
+                pass
+        start = text.find(opener, start + 1)
+    return None
+
+def _is_object_list(value: Any) -> bool:
+    """True for a JSON array whose items are all objects"""
+    return isinstance(value, list) and all(isinstance(item, dict) for item in value)
+
+def _decode_first_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """Decode the first JSON object embedded in text, skipping any preamble or trailing prose"""
+    value = _decode_outer_json_span(text, '{', '}')
+    if isinstance(value, dict):
+        return value
+    
+    # Trailing commentary or several objects: decode balanced spans instead
+    return _decode_first_balanced_json(text, '{', lambda candidate: isinstance(candidate, dict))
+
+class _TokenBucket:
+    """Async token bucket pacing requests to refill_rate per second with bursts up to capacity
+
+    Each acquire reserves its token immediately, letting the balance go negative, and then sleeps off
+    the debt; reserving never awaits, so concurrent callers on the event loop need no lock.
+    """
+    
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._tokens = capacity
+        self._updated = time.monotonic()
+    
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_rate)
+        self._updated = now
+        self._tokens -= 1
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.refill_rate)
+
+class _StreamingJsonArrayScanner:
+    """Spot the end of the first JSON array of objects in a streamed response
+
+    Bracket depth and string state carry across chunks, so each character is examined once and the
+    buffer is decoded only when a top-level array closes, instead of on every ']' that arrives.
+    """
+    
+    def __init__(self):
+        self._pieces: List[str] = []  # Text of the array currently being received
+        self._depth = 0
+        self._in_string = False
+        self._escaped_index = -1  # Absolute index of the character after a backslash inside a string
+        self._offset = 0
+    
+    def feed(self, chunk: str) -> Optional[List[Dict[str, Any]]]:
+        """Consume one streamed chunk; return the array once a complete array of objects has arrived"""
+        start = 0
+        for match in JSON_STRUCTURAL_PATTERN.finditer(chunk):
+            position = match.start()
+            char = match.group()
+            
+            if self._depth == 0:
+                if char == '[':
+                    self._depth = 1
+                    start = position
+                continue
+            
+            if self._in_string:
+                if self._offset + position == self._escaped_index:
+                    continue
+                if char == '\\':
+                    self._escaped_index = self._offset + position + 1
+                elif char == '"':
+                    self._in_string = False
+                continue
+            
+            if char == '"':
+                self._in_string = True
+            elif char in '[{':
+                self._depth += 1
+            elif char in ']}':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._pieces.append(chunk[start:position + 1])
+                    candidate = ''.join(self._pieces)
+                    self._pieces = []
+                    try:
+                        value = orjson.loads(candidate)
+                    except orjson.JSONDecodeError:
+                        continue
+                    # Prose such as "[1]" closes too; keep scanning for the real array
+                    if _is_object_list(value):
+                        return value
+        
+        if self._depth > 0:
+            self._pieces.append(chunk[start:])
+        self._offset += len(chunk)
+        return None
+
+def _decode_first_json_array(text: str) -> Optional[List[Dict[str, Any]]]:
+    """Decode the first JSON array of objects in text, skipping echoes like '[1]' in prose"""
+    value = _decode_outer_json_span(text, '[', ']')
+    if _is_object_list(value):
+        return value
+    
+    # Trailing commentary or prose echoes: decode balanced spans instead
+    return _decode_first_balanced_json(text, '[', _is_object_list)
+
+# Per-process state for pattern extraction workers, set once by _init_pattern_worker
+_pattern_worker_state: Dict[str, Any] = {}
+
+# One pool per process, created on first use and shared by every job. The worker is multi-threaded,
+# so children come from forkserver/spawn rather than a fork of this process, as in deduplication.
+_pattern_pool: Optional[ProcessPoolExecutor] = None
+_pattern_pool_lock = threading.Lock()
+
+def _get_pattern_pool() -> ProcessPoolExecutor:
+    """Return the shared pattern extraction pool, creating it on first use"""
+    global _pattern_pool
+    
+    with _pattern_pool_lock:
+        if _pattern_pool is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pattern_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                mp_context=multiprocessing.get_context(start_method),
+                initializer=_init_pattern_worker
+            )
+        return _pattern_pool
+
+def _init_pattern_worker() -> None:
+    """Create a bare engine once per worker process; the pattern helpers read no instance state"""
+    _pattern_worker_state['engine'] = ExtractionEngine.__new__(ExtractionEngine)
+
+def _extract_pattern_story(item: Tuple[str, str, str, int]) -> Optional[Dict[str, Any]]:
+    """Pattern-extract one (text, text_lower, filename, paragraph_index) item, as the non-LLM path does in-process"""
+    text, text_lower, filename, paragraph_index = item
+    engine = _pattern_worker_state['engine']
+    doc = {'filename': filename}
+    direct_match = DIRECT_STORY_PATTERN.search(text)
+    if direct_match:
+        return engine._story_from_direct_match(direct_match, text, doc, paragraph_index, text_lower)
+    return engine._extract_with_patterns(text, doc, paragraph_index, text_lower)
+
 class ExtractionEngine:
     """AI-powered extraction engine for user stories and requirements"""
     
-    def __init__(self, construct: Dict[str, Any], llm_provider: str = "gemini"):
+    def __init__(self, construct: Dict[str, Any], llm_provider: str = "gemini", max_concurrency: int = 16, max_batch_size: int = 16, batch_timeout: float = 0.02, max_batch_tokens: int = 3000, classifier_path: Optional[str] = None, cache_dir: Optional[str] = None, requests_per_minute: Optional[int] = None):
         self.construct = construct
         self.llm_provider = llm_provider
-        self.story_counter = 1  # Initialize sequential counter for user story IDs
+        
+        # Bound on in-flight LLM calls; the semaphore, batch queue and worker live on one event loop
+        # and are shared by every caller on it, so concurrent jobs batch and rate-limit together
+        self.max_concurrency = max_concurrency
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._llm_semaphore: Optional[asyncio.Semaphore] = None
+        
+        # Steady request pacing under the provider's rate limit, on top of the in-flight bound
+        requests_per_second = (requests_per_minute or PROVIDER_REQUESTS_PER_MINUTE.get(llm_provider, 60)) / 60
+        self._rate_limiter = _TokenBucket(capacity=max(1.0, requests_per_second), refill_rate=requests_per_second)
+        
+        # Dynamic micro-batching: paragraphs queued within batch_timeout seconds share one LLM call,
+        # up to max_batch_size paragraphs or roughly max_batch_tokens of paragraph text
+        self.max_batch_size = max_batch_size
+        self.batch_timeout = batch_timeout
+        self.max_batch_tokens = max_batch_tokens
+        self._batch_queue: Optional[asyncio.Queue] = None
+        self._batch_worker_task: Optional[asyncio.Task] = None
+        self._batch_tasks = set()
+        
+        # Response cache keyed by content hash, with paragraph embeddings for near-duplicate lookups;
+        # exact hits are also persisted under cache_dir so re-runs skip the LLM
+        self.cache_dir = cache_dir or os.getenv('EXTRACTION_CACHE_DIR', 'extraction_cache')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._response_cache: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._cache_index = SemanticIndex(RESPONSE_CACHE_MAX_ENTRIES)
+        self._embedding_model = None
+        self._embedding_model_lock = threading.Lock()
+        
+        # Cheap pre-filter ahead of LLM dispatch: a pickled sklearn pipeline exposing predict_proba
+        self.story_classifier = self._load_story_classifier(classifier_path or os.getenv('PARAGRAPH_CLASSIFIER_PATH'))
+        
+        # Static prompt text is formatted once; per-call builders only concatenate
+        self._build_prompt_templates()
+        
+        # Construct defaults are fixed per engine, so resolve them once for _structure_story
+        defaults = (self.construct or {}).get('defaults', {})
+        self._default_team = defaults.get('Team', 'Product')
+        self._default_category = defaults.get('Category', 'Workflow')
+        self._default_lifecycle_phase = defaults.get('Lifecycle Phase', 'Execution')
+        self._default_priority = defaults.get('Priority', 'Medium')
+        
+        # Cache entries are only valid for the cache format, provider, model and prompt that produced them
+        model_name = {"gemini": GEMINI_MODEL, "gemini_batch": GEMINI_BATCH_MODEL}.get(llm_provider, OPENAI_MODEL)
+        prompt_version = hashlib.sha256(self._batch_system_prompt.encode()).hexdigest()
+        self._cache_namespace = f"v{EXTRACTION_CACHE_VERSION}:{llm_provider}:{model_name}:{prompt_version}"
         
         # Initialize AI models with deterministic settings
-        if llm_provider == "gemini":
+        self.gemini_model = None
+        self.gemini_batch_client = None
+        self.openai_client = None
+        if llm_provider == "gemini_batch":
+            api_key = os.getenv('GEMINI_API_KEY')
+            if google_genai is None:
+                logger.warning("⚠️ google-genai not installed. Gemini batch extraction will fall back to pattern matching.")
+            elif not api_key:
+                logger.warning("⚠️ GEMINI_API_KEY not set. AI extraction will fall back to pattern matching.")
+            else:
+                try:
+                    self.gemini_batch_client = google_genai.Client(api_key=api_key)
+                    logger.info("✅ Gemini batch client initialized successfully")
+                except Exception as e:
+                    logger.error(f"❌ Error initializing Gemini batch client: {e}")
+                    self.gemini_batch_client = None
+        elif llm_provider == "gemini":
             api_key = os.getenv('GEMINI_API_KEY')
             if not api_key:
-                print("Warning: GEMINI_API_KEY not set. AI extraction will fall back to pattern matching.")
+                logger.warning("⚠️ GEMINI_API_KEY not set. AI extraction will fall back to pattern matching.")
                 self.gemini_model = None
             else:
                 try:
-                    self.gemini_model = GenerativeModel('gemini-pro')
-                    print("Gemini model initialized successfully")
+                    self.gemini_model = GenerativeModel(GEMINI_MODEL)
+                    logger.info("✅ Gemini model initialized successfully")
                 except Exception as e:
-                    print(f"Error initializing Gemini model: {str(e)}")
+                    logger.error(f"❌ Error initializing Gemini model: {e}")
                     self.gemini_model = None
-        elif llm_provider == "openai":
+        elif llm_provider in ("openai", "openai_batch"):
             api_key = os.getenv('OPENAI_API_KEY')
             if not api_key:
-                print("Warning: OPENAI_API_KEY not set. AI extraction will fall back to pattern matching.")
+                logger.warning("⚠️ OPENAI_API_KEY not set. AI extraction will fall back to pattern matching.")
                 self.openai_client = None
             else:
                 try:
-                    self.openai_client = openai.OpenAI(api_key=api_key)
-                    print("OpenAI client initialized successfully")
+                    # One async client per engine over a pooled HTTP/2 connection, so concurrent
+                    # batch calls multiplex over a single TLS session instead of opening one each
+                    http_client = httpx.AsyncClient(
+                        http2=True,
+                        limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+                        timeout=30
+                    )
+                    self.openai_client = openai.AsyncOpenAI(api_key=api_key, max_retries=2, timeout=30, http_client=http_client)
+                    logger.info("✅ OpenAI client initialized successfully")
                 except Exception as e:
-                    print(f"Error initializing OpenAI client: {str(e)}")
+                    logger.error(f"❌ Error initializing OpenAI client: {e}")
                     self.openai_client = None
         
         # Workflow management specific patterns
@@ -60,82 +456,196 @@ class ExtractionEngine:
             "Access control should {permission} based on {criteria}"
         ]
     
-    def _generate_sequential_id(self) -> str:
-        """Generate sequential user story ID: US-1, US-2, etc."""
-        story_id = f"US-{self.story_counter}"
-        self.story_counter += 1
-        return story_id
-    
+    def _build_prompt_templates(self):
+        """Precompute the static prompt parts; construct guidance is fixed per engine
+
+        All static instructions sit at the start of each prompt and the per-call text at the end,
+        so every call shares a byte-identical prefix that provider prompt caches can reuse.
+        """
+        construct_guidance = self._get_construct_guidance()
+        
+        self._batch_system_prompt = f"""
+You are an expert business analyst extracting user stories from interview transcripts.
+Each numbered paragraph you are given is independent. For each paragraph that contains a clear user story, return one JSON object.
+
+{construct_guidance}
+
+Respond with ONLY a JSON array. Each element must have these keys:
+"idx" (the paragraph number), "role", "capability", "benefit", "category", "priority",
+"source_text", "requirements" (list of strings), "acceptance_criteria" (list of strings).
+Omit paragraphs that do not contain a user story.
+"""
+        
+        self._context_prompt_prefix = f"""
+You are an expert business analyst specializing in extracting user stories from interview transcripts. Your task is to analyze the provided text and identify clear, actionable user stories.
+
+EXTRACTION GUIDELINES:
+
+1. **ROLE IDENTIFICATION**: Look for who is speaking or who needs the capability
+   - Examples: "workflow manager", "content creator", "system administrator"
+   - Extract stakeholder names and roles when mentioned
+
+2. **CAPABILITY NEEDS**: Identify what the person wants to accomplish
+   - Look for phrases like "I need to", "I want to", "I should be able to"
+   - Focus on business capabilities, not just technical features
+
+3. **BUSINESS VALUE**: Understand why this capability is important
+   - Look for phrases like "so that", "in order to", "because"
+   - Identify efficiency gains, cost savings, compliance needs, etc.
+
+4. **CATEGORIZATION**: Classify the user story appropriately
+   - Workflow: Process improvements, approvals, notifications
+   - DAM: Digital asset management, content organization
+   - Integration: System connections, data flows, APIs
+   - Security: Access control, authentication, compliance
+
+5. **PRIORITY ASSESSMENT**: Determine business priority
+   - HIGH: Critical business functions, security, compliance, revenue impact
+   - MEDIUM: Important operational features, user experience improvements
+   - LOW: Nice-to-have features, minor improvements, future enhancements
+
+{construct_guidance}
+
+OUTPUT FORMAT:
+Generate exactly ONE user story per text segment. Use this exact format:
+
+User Story: [Complete user story in "As a [role], I need [capability] so that [business value]" format]
+Capability: [Specific capability or feature needed]
+Category: [Workflow/DAM/Integration/Security/Other]
+Priority: [HIGH/MEDIUM/LOW]
+Snippet: [Key quote or phrase from the text that supports this story]
+Team: [Team or department mentioned, if any]
+Stakeholder: [Specific person mentioned, if any]
+
+EXAMPLE:
+User Story: As a workflow manager, I need to approve document submissions so that I can ensure quality control and compliance.
+Capability: Document approval workflow
+Category: Workflow
+Priority: HIGH
+Snippet: "I need to approve all submissions before they go live"
+Team: Operations
+Stakeholder: Sarah Johnson
+
+Analyze the text thoroughly and extract the most relevant user story. If no clear user story is present, return null.
+"""
+
     async def extract_stories(self, processed_documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Extract user stories from processed documents using AI with deterministic processing"""
-        all_stories = []
-        
         # Sort documents by filename for consistent processing order
         sorted_docs = sorted(processed_documents, key=lambda x: x['filename'])
         
-        for doc in sorted_docs:
-            try:
-                # Extract stories from each paragraph with consistent ordering
-                doc_stories = await self._extract_from_document(doc)
-                all_stories.extend(doc_stories)
-            except Exception as e:
-                print(f"Error extracting stories from {doc['filename']}: {str(e)}")
+        if self.llm_provider in BATCH_API_PROVIDERS:
+            # Offline run: one Batch API job covers every relevant paragraph
+            all_stories = await self._extract_with_batch_api(sorted_docs)
+            all_stories.sort(key=self._story_sort_key)
+            return all_stories
+        
+        # Group relevant paragraphs across all documents so repeated content is extracted once
+        unique_paragraphs = self._group_unique_paragraphs(sorted_docs)
+        
+        if self.llm_provider not in ("gemini", "openai") and len(unique_paragraphs) >= PATTERN_PARALLEL_THRESHOLD:
+            # Pattern-only runs are CPU-bound, so large ones spread across processes instead of coroutines
+            results = await asyncio.get_running_loop().run_in_executor(
+                None, self._extract_patterns_parallel, list(unique_paragraphs.values())
+            )
+        else:
+            # Extract each unique paragraph concurrently; gather keeps results in group order
+            results = await asyncio.gather(
+                *[
+                    self._extract_story_from_text(paragraph, doc, i, paragraph_lower)
+                    for (doc, i, paragraph, paragraph_lower), *_ in unique_paragraphs.values()
+                ],
+                return_exceptions=True
+            )
+        
+        placements = []
+        for occurrences, story in zip(unique_paragraphs.values(), results):
+            first_doc, first_index, _, _ = occurrences[0]
+            if isinstance(story, Exception):
+                logger.error(f"❌ Error processing paragraph {first_index} of {first_doc['filename']}: {story}")
+                continue
+            if not story:
                 continue
+            # Fan the story out to every repeat of the paragraph
+            placements.extend((doc, i, paragraph, story) for doc, i, paragraph, _ in occurrences)
         
-        # Apply construct template and defaults
-        structured_stories = await self._apply_construct_template(all_stories)
+        all_stories = self._place_stories(placements)
         
         # Sort stories by consistent hash for deterministic output
-        structured_stories.sort(key=lambda x: self._generate_story_hash(x))
+        all_stories.sort(key=self._story_sort_key)
         
-        return structured_stories
+        return all_stories
     
-    def _generate_story_hash(self, story: Dict[str, Any]) -> str:
-        """Generate a consistent hash for story sorting"""
-        # Create a deterministic string representation
-        story_key = f"{story.get('User Story', '')}{story.get('Source', '')}{story.get('paragraph_index', 0)}"
-        return hashlib.md5(story_key.encode()).hexdigest()
-    
-    async def _extract_from_document(self, doc: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Extract user stories from a single document with consistent processing"""
+    def _extract_patterns_parallel(self, groups: List[List[Tuple[Dict[str, Any], int, str, str]]]) -> List[Optional[Dict[str, Any]]]:
+        """Pattern-extract the first occurrence of each paragraph group across a process pool, in group order"""
+        items = [(paragraph, paragraph_lower, doc['filename'], i) for (doc, i, paragraph, paragraph_lower), *_ in groups]
+        return list(_get_pattern_pool().map(_extract_pattern_story, items, chunksize=PATTERN_CHUNK_SIZE))
+
+    def _place_stories(self, placements: List[Tuple[Dict[str, Any], int, str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Number and output-shape (doc, paragraph_index, text, story) placements
+
+        IDs follow (filename, paragraph_index) order within this call, so they are a pure function
+        of the input documents rather than of LLM completion order or earlier jobs.
+        """
+        placements.sort(key=lambda placement: (placement[0]['filename'], placement[1]))
         stories = []
-        paragraphs = doc.get('paragraphs', [])
-        
-        # Process paragraphs in consistent order
-        for i, paragraph in enumerate(paragraphs):
-            try:
-                # Check if paragraph contains workflow or DAM content
-                if self._is_relevant_content(paragraph):
-                    story = await self._extract_story_from_text(paragraph, doc, i)
-                    if story:
-                        stories.append(story)
-            except Exception as e:
-                print(f"Error processing paragraph {i}: {str(e)}")
-                continue
-        
-        # Sort stories by paragraph index for consistency
-        stories.sort(key=lambda x: x.get('paragraph_index', 0))
+        for number, (doc, _, text, story) in enumerate(placements, 1):
+            self._append_final_story(stories, story, f"US-{number}", doc, text)
         return stories
+
+    def _group_unique_paragraphs(self, sorted_docs: List[Dict[str, Any]]) -> Dict[str, List[Tuple[Dict[str, Any], int, str, str]]]:
+        """Group relevant paragraphs by normalized content hash, keeping every (doc, index, text, text_lower) occurrence
+
+        The lowercased text is kept so pattern extraction can reuse it instead of lowering again.
+        """
+        unique_paragraphs: Dict[str, List[Tuple[Dict[str, Any], int, str, str]]] = {}
+        for doc in sorted_docs:
+            for i, paragraph, paragraph_lower in self._select_paragraphs(doc):
+                key = xxhash.xxh3_128_hexdigest(paragraph_lower.strip())
+                unique_paragraphs.setdefault(key, []).append((doc, i, paragraph, paragraph_lower))
+        return unique_paragraphs
+
+    def _story_sort_key(self, story: Dict[str, Any]) -> Tuple[str, str, int]:
+        """Deterministic sort key for stories; a plain tuple compare needs no hashing"""
+        return (story.get('User Story', ''), story.get('Source', ''), story.get('paragraph_index', 0))
     
-    def _is_relevant_content(self, text: str) -> bool:
-        """Check if text contains relevant workflow or DAM content"""
-        text_lower = text.lower()
-        
-        workflow_keywords = [
-            'workflow', 'process', 'approval', 'review', 'sign-off',
-            'routing', 'escalation', 'notification', 'automation',
-            'business rules', 'decision points', 'status', 'state',
-            'escalate', 'route', 'approve', 'reject', 'notify'
-        ]
+    def _load_story_classifier(self, classifier_path: Optional[str]):
+        """Load the optional pickled paragraph classifier, or None when not configured"""
+        if not classifier_path:
+            return None
+        try:
+            with open(classifier_path, 'rb') as f:
+                classifier = pickle.load(f)
+            logger.info(f"✅ Paragraph classifier loaded from {classifier_path}")
+            return classifier
+        except Exception as e:
+            logger.warning(f"⚠️ Error loading paragraph classifier: {e}")
+            return None
+
+    def _select_paragraphs(self, doc: Dict[str, Any]) -> List[Tuple[int, str, str]]:
+        """Return (index, paragraph, paragraph_lower) worth sending to the LLM: keyword-relevant, then classifier-approved
+
+        Each paragraph is lowercased once here and the result is threaded to every later keyword scan.
+        """
+        relevant = []
+        for i, paragraph in enumerate(doc.get('paragraphs', [])):
+            paragraph_lower = paragraph.lower()
+            if self._is_relevant_content(paragraph_lower):
+                relevant.append((i, paragraph, paragraph_lower))
+        if not relevant or self.story_classifier is None:
+            return relevant
         
-        dam_keywords = [
-            'digital asset', 'asset management', 'metadata', 'tagging',
-            'version control', 'access control', 'permissions', 'search',
-            'categorization', 'workflow integration', 'asset', 'file',
-            'upload', 'download', 'share', 'collaborate'
-        ]
+        try:
+            probabilities = self.story_classifier.predict_proba([paragraph for _, paragraph, _ in relevant])[:, 1]
+        except Exception as e:
+            logger.warning(f"⚠️ Error scoring paragraphs with classifier: {e}")
+            return relevant
         
-        return any(keyword in text_lower for keyword in workflow_keywords + dam_keywords)
+        return [item for item, probability in zip(relevant, probabilities) if probability >= STORY_CLASSIFIER_THRESHOLD]
+
+    def _is_relevant_content(self, text_lower: str) -> bool:
+        """Check if lowercased text contains relevant workflow or DAM content"""
+        return next(RELEVANT_CONTENT_AUTOMATON.iter(text_lower), None) is not None
     
     def _get_construct_guidance(self) -> str:
         """Get construct-specific guidance for the AI prompt"""
@@ -149,75 +659,589 @@ class ExtractionEngine:
         
         guidance = f"""
 SPECIFIC OUTPUT SCHEMA: {', '.join(output_schema)}
-DEFAULT VALUES: {', '.join([f'{k}: {v}' for k, v in defaults.items()])}
+DEFAULT VALUES: {', '.join([f'{k}: {v}' for k, v in sorted(defaults.items())])}
 PRIORITY RULES: {'; '.join(priority_rules)}
 """
         return guidance
 
-    async def _extract_story_from_text(self, text: str, doc: Dict[str, Any], paragraph_index: int) -> Optional[Dict[str, Any]]:
+    async def _extract_story_from_text(self, text: str, doc: Dict[str, Any], paragraph_index: int, text_lower: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """Extract a single user story from text using AI with enhanced analysis"""
         try:
-            # Enhanced text preprocessing for better AI analysis
-            processed_text = self._preprocess_text_for_analysis(text)
+            direct_match = DIRECT_STORY_PATTERN.search(text)
+            if direct_match:
+                return self._story_from_direct_match(direct_match, text, doc, paragraph_index, text_lower)
             
-            if self.llm_provider == "gemini":
-                return await self._extract_with_gemini(processed_text, doc, paragraph_index)
-            elif self.llm_provider == "openai":
-                return await self._extract_with_openai(processed_text, doc, paragraph_index)
+            if self.llm_provider in ("gemini", "openai"):
+                hit, cached_story, embedding = await self._lookup_cached_story(text)
+                if hit:
+                    return self._restamp_cached_story(cached_story, text, doc, paragraph_index)
+                
+                # Queue for the next micro-batch; the batch worker resolves the future
+                story = await self._submit_to_batch(text, doc, paragraph_index, text_lower)
+                
+                # Pattern fallbacks are not cached so a later run can still reach the LLM
+                if story is None or story.get('extraction_method') == 'ai':
+                    self._store_cached_story(text, story, embedding)
+                return story
             else:
-                return self._extract_with_patterns(processed_text, doc, paragraph_index)
+                return self._extract_with_patterns(text, doc, paragraph_index, text_lower)
         except Exception as e:
-            print(f"Error in AI extraction: {str(e)}")
-            return self._extract_with_patterns(text, doc, paragraph_index)
+            logger.error(f"❌ Error in AI extraction: {e}")
+            return self._extract_with_patterns(text, doc, paragraph_index, text_lower)
 
-    async def extract_story_from_text_with_context(self, text: str, doc: Dict[str, Any], paragraph_index: int, context_chunks: List[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
-        """Extract user story using Gemini AI with enhanced context from vectorized chunks"""
-        if not self.gemini_model:
-            logger.warning("Gemini model not available, falling back to pattern matching")
-            return self._extract_with_patterns(text, doc, paragraph_index)
+    async def _embed_for_cache(self, text: str) -> Optional[np.ndarray]:
+        """Embed text for semantic cache lookups, or None when no embedding model is available"""
+        if SentenceTransformer is None:
+            return None
+        # Model loading and encoding are CPU-bound; keep them off the event loop
+        return await asyncio.to_thread(self._embed_for_cache_sync, text)
+
+    def _embed_for_cache_sync(self, text: str) -> Optional[np.ndarray]:
+        """Load the embedding model on first use and encode text"""
+        with self._embedding_model_lock:
+            if self._embedding_model is None:
+                try:
+                    self._embedding_model = SentenceTransformer(SEMANTIC_CACHE_MODEL)
+                except Exception as e:
+                    logger.warning(f"⚠️ Error loading cache embedding model: {e}")
+                    return None
+        return self._embedding_model.encode(text, normalize_embeddings=True)
+
+    async def _lookup_cached_story(self, text: str) -> Tuple[bool, Optional[Dict[str, Any]], Optional[np.ndarray]]:
+        """Find a cached extraction for identical or semantically similar text
+
+        Returns (hit, cached_story, embedding); the embedding is reused when storing a miss.
+        """
+        cache_key = self._response_cache_key(text)
+        if cache_key in self._response_cache:
+            return True, self._response_cache[cache_key], None
+        
+        hit, story = self._load_cached_response(cache_key)
+        if hit:
+            self._response_cache[cache_key] = story
+            self._evict_cached_responses()
+            return True, story, None
+        
+        embedding = await self._embed_for_cache(text)
+        if embedding is not None:
+            match = self._cache_index.most_similar(embedding)
+            if match is not None and match[0] >= SEMANTIC_CACHE_THRESHOLD:
+                return True, match[1], embedding
+        
+        return False, None, embedding
+
+    def _store_cached_story(self, text: str, story: Optional[Dict[str, Any]], embedding: Optional[np.ndarray]):
+        """Cache an extraction result under the text's cache key and embedding"""
+        cache_key = self._response_cache_key(text)
+        self._response_cache[cache_key] = story
+        self._save_cached_response(cache_key, story)
+        
+        if embedding is not None:
+            self._cache_index.add(embedding, story)
+        self._evict_cached_responses()
+
+    def _evict_cached_responses(self):
+        """Drop the oldest in-memory entries once over the cap; persisted entries expire by TTL and the semantic index bounds itself"""
+        if len(self._response_cache) <= RESPONSE_CACHE_MAX_ENTRIES:
+            return
+        
+        # Dicts keep insertion order, so the first keys are the oldest
+        for cache_key in list(itertools.islice(self._response_cache, len(self._response_cache) - RESPONSE_CACHE_EVICT_TO)):
+            del self._response_cache[cache_key]
+
+    def _response_cache_key(self, text: str) -> str:
+        """Cache key for a paragraph: its content hash scoped to provider, model and prompt version"""
+        return xxhash.xxh3_128_hexdigest(f"{self._cache_namespace}:{self._generate_content_hash(text)}")
+
+    def _load_cached_response(self, cache_key: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Load a persisted extraction result; returns (hit, story) since a cached None is a valid result"""
+        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
+        try:
+            if time.time() - os.path.getmtime(cache_file) > EXTRACTION_CACHE_TTL_SECONDS:
+                return False, None
+        except OSError:
+            return False, None
+        
+        try:
+            with open(cache_file, 'rb') as f:
+                return True, orjson.loads(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Ignoring unreadable extraction cache entry {cache_key}: {e}")
+            return False, None
+
+    def _save_cached_response(self, cache_key: str, story: Optional[Dict[str, Any]]):
+        """Persist an extraction result for future runs"""
+        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
+        try:
+            with open(cache_file, 'wb') as f:
+                f.write(orjson.dumps(story))
+        except (OSError, TypeError) as e:
+            logger.warning(f"⚠️ Failed to write extraction cache entry {cache_key}: {e}")
+
+    def _restamp_cached_story(self, story: Optional[Dict[str, Any]], text: str, doc: Dict[str, Any], paragraph_index: int) -> Optional[Dict[str, Any]]:
+        """Copy a cached story and point it at the current paragraph"""
+        if story is None:
+            return None
+        
+        restamped = story.copy()
+        restamped['user_story_id'] = ''  # Assigned once stories are placed in output order
+        restamped['source_file'] = doc['filename']
+        restamped['paragraph_index'] = paragraph_index
+        restamped['content_hash'] = self._generate_content_hash(text)
+        return restamped
+
+    async def _submit_to_batch(self, text: str, doc: Dict[str, Any], paragraph_index: int, text_lower: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Enqueue a paragraph for batched extraction and wait for its story"""
+        self._ensure_batch_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._batch_queue.put((text, doc, paragraph_index, future, text_lower))
+        return await future
+
+    def _bind_to_running_loop(self):
+        """Create the loop-bound semaphore and queue the first time they are used from a new event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._llm_semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._batch_queue = asyncio.Queue()
+            self._batch_worker_task = None
+
+    def _ensure_batch_worker(self):
+        """Start the shared batch worker in the running event loop if it is not already running"""
+        self._bind_to_running_loop()
+        if self._batch_worker_task is None or self._batch_worker_task.done():
+            self._batch_worker_task = asyncio.create_task(self._batch_worker())
+
+    async def _batch_worker(self):
+        """Collect queued paragraphs into micro-batches and dispatch each as one LLM call"""
+        loop = asyncio.get_running_loop()
+        carry = None
+        while True:
+            batch = [carry if carry is not None else await self._batch_queue.get()]
+            carry = None
+            batch_tokens = _estimate_tokens(batch[0][0])
+            deadline = loop.time() + self.batch_timeout
             
-        prompt = self._build_extraction_prompt_with_context(text, doc, paragraph_index, context_chunks)
+            # Keep filling the batch until it is full or the wait window closes
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._batch_queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                item_tokens = _estimate_tokens(item[0])
+                if batch_tokens + item_tokens > self.max_batch_tokens:
+                    # Over the token budget - this paragraph opens the next batch
+                    carry = item
+                    break
+                batch.append(item)
+                batch_tokens += item_tokens
+            
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch: List[tuple]):
+        """Extract one micro-batch and resolve each waiting paragraph's future"""
+        items = [(doc, paragraph_index, text) for text, doc, paragraph_index, _, _ in batch]
+        try:
+            async with self._llm_slot():
+                stories = await self._batch_extract(items)
+            fallback = False
+        except Exception as e:
+            logger.error(f"❌ Error in batched AI extraction: {e}")
+            stories = [None] * len(batch)
+            fallback = True
         
-        # Log the analysis process
-        logger.info(f"\n🤖 GEMINI ANALYSIS WITH CONTEXT STARTED")
-        logger.info(f"📄 Document: {doc.get('filename', 'Unknown')}")
-        logger.info(f"📝 Paragraph: {paragraph_index + 1}")
-        logger.info(f"📊 Text Length: {len(text)} characters")
-        logger.info(f"🔍 Context Chunks: {len(context_chunks) if context_chunks else 0}")
-        logger.info(f"📊 Text Preview: {text[:100]}...")
+        for (text, doc, paragraph_index, future, text_lower), story in zip(batch, stories):
+            if future.done():
+                continue
+            if fallback:
+                story = self._extract_with_patterns(text, doc, paragraph_index, text_lower)
+            future.set_result(story)
+
+    async def _batch_extract(self, items: List[tuple]) -> List[Optional[Dict[str, Any]]]:
+        """Extract stories for several (doc, paragraph_index, text) items with a single LLM call"""
+        prompt = self._build_batch_extraction_prompt([text for _, _, text in items])
+        response_text = await self._call_llm(self._batch_system_prompt, prompt, STORY_OUTPUT_TOKENS * len(items))
+        entries = self._parse_batch_response(response_text)
+        if entries is None:
+            # Unparseable reply: raise so _run_batch falls back to per-paragraph extraction
+            raise ValueError("batched AI response contained no JSON array")
         
+        stories = []
+        for position, (doc, paragraph_index, text) in enumerate(items, 1):
+            story_data = entries.get(position)
+            stories.append(self._story_from_ai_data(story_data, text, doc, paragraph_index) if story_data else None)
+        return stories
+
+    def _build_batch_extraction_prompt(self, texts: List[str]) -> str:
+        """Build one prompt that enumerates every paragraph in the batch"""
+        numbered_texts = "\n\n".join(f"[{position}] {text}" for position, text in enumerate(texts, 1))
+        return "PARAGRAPHS:\n" + numbered_texts
+
+    def _parse_batch_response(self, ai_response: str) -> Optional[Dict[int, Dict[str, Any]]]:
+        """Parse a batched AI response into story data keyed by paragraph number; None if no array was found"""
+        entries = {}
         try:
-            # Generate content using Gemini with enhanced configuration
-            response = await self.gemini_model.generate_content_async(
-                prompt,
+            story_list = _decode_first_json_array(ai_response)
+            if story_list is None:
+                return None
+            
+            for story_data in story_list:
+                if all(key in story_data for key in ['idx', 'role', 'capability', 'benefit']):
+                    entries[int(story_data['idx'])] = story_data
+        except Exception as e:
+            logger.error(f"❌ Error parsing batched AI response: {e}")
+        
+        return entries
+
+    def _story_from_ai_data(self, story_data: Dict[str, Any], text: str, doc: Dict[str, Any], paragraph_index: int) -> Dict[str, Any]:
+        """Build a normalized story from one parsed AI story object"""
+        return {
+            'user_story_id': '',  # Assigned once stories are placed in output order
+            'role': self._normalize_text(story_data.get('role', 'User')),
+            'capability': self._normalize_text(story_data.get('capability', '')),
+            'benefit': self._normalize_text(story_data.get('benefit', '')),
+            'category': story_data.get('category', 'workflow'),
+            'priority': story_data.get('priority', 'medium'),
+            'source_text': story_data.get('source_text', ''),
+            'requirements': story_data.get('requirements', []),
+            'acceptance_criteria': story_data.get('acceptance_criteria', []),
+            'source_file': doc['filename'],
+            'paragraph_index': paragraph_index,
+            'extraction_method': 'ai',
+            'confidence_score': 0.8,
+            'content_hash': self._generate_content_hash(text)
+        }
+
+    def _story_from_direct_match(self, match: re.Match, text: str, doc: Dict[str, Any], paragraph_index: int, text_lower: Optional[str] = None) -> Dict[str, Any]:
+        """Build a story straight from an explicit "As a X, I need Y so that Z" sentence"""
+        if text_lower is None:
+            text_lower = text.lower()
+        
+        return {
+            'user_story_id': '',  # Assigned once stories are placed in output order
+            'role': self._normalize_text(match.group('role')),
+            'capability': self._normalize_text(match.group('capability')),
+            'benefit': self._normalize_text(match.group('benefit')),
+            'category': self._detect_category(text_lower),
+            'priority': 'medium',
+            'source_text': text[:200],
+            'requirements': [],
+            'acceptance_criteria': [],
+            'source_file': doc['filename'],
+            'paragraph_index': paragraph_index,
+            'extraction_method': 'regex',
+            'confidence_score': 0.95,
+            'content_hash': self._generate_content_hash(text)
+        }
+
+    async def _call_llm(self, system_prompt: str, prompt: str, max_output_tokens: int) -> str:
+        """Stream a prompt to the configured provider and return the response text
+
+        The static system prompt always comes first (as the system message for OpenAI), so repeated
+        calls share a cacheable prefix.
+
+        Streaming stops as soon as the response holds a complete JSON array of objects,
+        so trailing prose from the model is never waited on.
+        """
+        pieces = []
+        scanner = _StreamingJsonArrayScanner()
+        
+        if self.llm_provider == "gemini":
+            if not self.gemini_model:
+                raise RuntimeError("Gemini model not available")
+            response = await self._send_llm_request(lambda: self.gemini_model.generate_content_async(
+                system_prompt + "\n" + prompt,
                 generation_config=genai.types.GenerationConfig(
                     temperature=0.3,  # Lower temperature for more consistent output
                     top_p=0.8,
                     top_k=40,
-                    max_output_tokens=2048,
-                )
+                    max_output_tokens=max_output_tokens,
+                ),
+                stream=True
+            ))
+            async for chunk in response:
+                delta = chunk.text
+                pieces.append(delta)
+                if scanner.feed(delta) is not None:
+                    break
+            return ''.join(pieces)
+        
+        if self.llm_provider == "openai":
+            if not self.openai_client:
+                raise RuntimeError("OpenAI client not available")
+            stream = await self._send_llm_request(lambda: self.openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
+                temperature=0.3,
+                max_tokens=max_output_tokens,
+                stream=True
+            ))
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content or ""
+                    pieces.append(delta)
+                    if scanner.feed(delta) is not None:
+                        break
+            finally:
+                await stream.close()
+            return ''.join(pieces)
+        
+        raise ValueError(f"Unsupported LLM provider: {self.llm_provider}")
+
+    async def _extract_with_batch_api(self, sorted_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Extract stories for all documents through the provider's Batch API (offline, lower cost)"""
+        items = []
+        placements = []
+        # Repeated paragraphs are submitted once; each result fans out to every occurrence
+        occurrences_by_item = {}
+        embeddings_by_item = {}
+        for occurrences in self._group_unique_paragraphs(sorted_docs).values():
+            doc, i, paragraph, paragraph_lower = occurrences[0]
+            # Explicit stories and cached extractions never need to go into the batch
+            direct_match = DIRECT_STORY_PATTERN.search(paragraph)
+            if direct_match:
+                story = self._story_from_direct_match(direct_match, paragraph, doc, i, paragraph_lower)
+            else:
+                hit, cached_story, embedding = await self._lookup_cached_story(paragraph)
+                if not hit:
+                    items.append((doc, i, paragraph))
+                    occurrences_by_item[(doc['filename'], i)] = occurrences
+                    embeddings_by_item[(doc['filename'], i)] = embedding
+                    continue
+                story = self._restamp_cached_story(cached_story, paragraph, doc, i)
+            if story:
+                placements.extend((occurrence_doc, j, text, story) for occurrence_doc, j, text, _ in occurrences)
+        
+        if not items:
+            return self._place_stories(placements)
+        
+        # Each batch request carries one micro-batch prompt
+        chunks = self._chunk_batch_items(items)
+        
+        try:
+            if self.llm_provider == "gemini_batch":
+                responses = await self._run_gemini_batch(chunks)
+            else:
+                responses = await self._run_openai_batch(chunks)
+        except Exception as e:
+            logger.error(f"❌ Error in batch API extraction: {e}")
+            responses = {}
+        
+        for n, chunk in enumerate(chunks):
+            response_text = responses.get(f"chunk-{n}")
+            entries = self._parse_batch_response(response_text) if response_text is not None else None
+            if entries is None:
+                # Missing, failed or unparseable result - fall back to pattern extraction for this chunk
+                chunk_stories = [self._extract_with_patterns(text, doc, i) for doc, i, text in chunk]
+            else:
+                chunk_stories = [
+                    self._story_from_ai_data(entries[position], text, doc, i) if entries.get(position) else None
+                    for position, (doc, i, text) in enumerate(chunk, 1)
+                ]
+                # Only parsed AI results are cached so pattern fallbacks can still reach the LLM later
+                for (doc, i, text), story in zip(chunk, chunk_stories):
+                    self._store_cached_story(text, story, embeddings_by_item[(doc['filename'], i)])
+            
+            for (doc, i, _), story in zip(chunk, chunk_stories):
+                if story:
+                    occurrences = occurrences_by_item[(doc['filename'], i)]
+                    placements.extend((occurrence_doc, j, text, story) for occurrence_doc, j, text, _ in occurrences)
+        
+        return self._place_stories(placements)
+
+    def _chunk_batch_items(self, items: List[tuple]) -> List[List[tuple]]:
+        """Split (doc, paragraph_index, text) items into chunks bounded by max_batch_size and max_batch_tokens"""
+        chunks = []
+        chunk = []
+        chunk_tokens = 0
+        for item in items:
+            item_tokens = _estimate_tokens(item[2])
+            if chunk and (len(chunk) >= self.max_batch_size or chunk_tokens + item_tokens > self.max_batch_tokens):
+                chunks.append(chunk)
+                chunk = []
+                chunk_tokens = 0
+            chunk.append(item)
+            chunk_tokens += item_tokens
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    async def _run_openai_batch(self, chunks: List[List[tuple]]) -> Dict[str, str]:
+        """Submit chunk prompts as an OpenAI batch, wait for it, and return response text by custom_id"""
+        if not self.openai_client:
+            raise RuntimeError("OpenAI client not available")
+        client = self.openai_client
+        
+        request_lines = [
+            orjson.dumps({
+                'custom_id': f"chunk-{n}",
+                'method': 'POST',
+                'url': '/v1/chat/completions',
+                'body': {
+                    'model': OPENAI_MODEL,
+                    'messages': [
+                        {'role': 'system', 'content': self._batch_system_prompt},
+                        {'role': 'user', 'content': self._build_batch_extraction_prompt([text for _, _, text in chunk])}
+                    ],
+                    'temperature': 0.3,
+                    'max_tokens': STORY_OUTPUT_TOKENS * len(chunk)
+                }
+            })
+            for n, chunk in enumerate(chunks)
+        ]
+        
+        batch_file = await client.files.create(
+            file=('extraction_requests.jsonl', b'\n'.join(request_lines)),
+            purpose='batch'
+        )
+        batch = await client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint='/v1/chat/completions',
+            completion_window='24h'
+        )
+        
+        while batch.status not in BATCH_TERMINAL_STATUSES:
+            await asyncio.sleep(BATCH_POLL_INTERVAL_SECONDS)
+            batch = await client.batches.retrieve(batch.id)
+        
+        if batch.status != 'completed' or not batch.output_file_id:
+            raise RuntimeError(f"OpenAI batch {batch.id} ended with status {batch.status}")
+        
+        output = await client.files.content(batch.output_file_id)
+        
+        responses = {}
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            result = orjson.loads(line)
+            response = result.get('response') or {}
+            if response.get('status_code') == 200:
+                responses[result['custom_id']] = response['body']['choices'][0]['message']['content']
+        return responses
+
+    async def _run_gemini_batch(self, chunks: List[List[tuple]]) -> Dict[str, str]:
+        """Submit chunk prompts as a Gemini Batch Mode job, wait for it, and return response text by chunk id"""
+        if not self.gemini_batch_client:
+            raise RuntimeError("Gemini batch client not available")
+        client = self.gemini_batch_client.aio
+        
+        # Inline requests come back in submission order, so the position identifies the chunk
+        inline_requests = [
+            {
+                'contents': [{'role': 'user', 'parts': [{'text': self._build_batch_extraction_prompt([text for _, _, text in chunk])}]}],
+                'config': {
+                    'system_instruction': self._batch_system_prompt,
+                    'temperature': 0.3,
+                    'top_p': 0.8,
+                    'top_k': 40,
+                    'max_output_tokens': STORY_OUTPUT_TOKENS * len(chunk)
+                }
+            }
+            for chunk in chunks
+        ]
+        job = await client.batches.create(
+            model=GEMINI_BATCH_MODEL,
+            src=inline_requests,
+            config={'display_name': 'interview-story-extraction'}
+        )
+        
+        while job.state.name not in GEMINI_BATCH_TERMINAL_STATES:
+            await asyncio.sleep(BATCH_POLL_INTERVAL_SECONDS)
+            job = await client.batches.get(name=job.name)
+        
+        inlined_responses = job.dest.inlined_responses if job.dest else None
+        if job.state.name not in ('JOB_STATE_SUCCEEDED', 'JOB_STATE_PARTIALLY_SUCCEEDED') or not inlined_responses:
+            raise RuntimeError(f"Gemini batch {job.name} ended with state {job.state.name}")
+        
+        responses = {}
+        for n, inlined in enumerate(inlined_responses):
+            if inlined.response is not None and inlined.error is None:
+                responses[f"chunk-{n}"] = inlined.response.text
+        return responses
+
+    async def _send_llm_request(self, make_request):
+        """Send a provider request paced by the rate limiter, retrying rate-limit rejections with exponential backoff"""
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            await self._rate_limiter.acquire()
+            try:
+                return await make_request()
+            except RATE_LIMIT_ERRORS as e:
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                delay = LLM_RETRY_BASE_DELAY * 2 ** attempt
+                logger.warning(f"⏳ LLM rate limited, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+
+    def _llm_slot(self) -> asyncio.Semaphore:
+        """Return the semaphore bounding concurrent LLM calls on the running event loop"""
+        self._bind_to_running_loop()
+        return self._llm_semaphore
+
+    async def extract_story_from_text_with_context(self, text: str, doc: Dict[str, Any], paragraph_index: int, context_chunks: List[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Extract user story using Gemini AI with enhanced context from vectorized chunks"""
+        if not self.gemini_model:
+            logger.warning("Gemini model not available, falling back to pattern matching")
+            return self._extract_with_patterns_standalone(text, doc, paragraph_index)
+            
+        prompt = self._build_extraction_prompt_with_context(text, doc, paragraph_index, context_chunks)
+        
+        # Per-paragraph trace is debug-only; arguments are formatted lazily and previews sliced only when enabled
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(
+                "🤖 Gemini analysis with context: 📄 %s, 📝 paragraph %d, 📊 %d characters, 🔍 %d context chunks, preview: %s...",
+                doc.get('filename', 'Unknown'), paragraph_index + 1, len(text),
+                len(context_chunks) if context_chunks else 0, text[:100]
             )
+        
+        try:
+            # Generate content using Gemini with enhanced configuration, sharing the engine-wide call limit
+            async with self._llm_slot():
+                response = await self._send_llm_request(lambda: self.gemini_model.generate_content_async(
+                    prompt,
+                    generation_config=genai.types.GenerationConfig(
+                        temperature=0.3,  # Lower temperature for more consistent output
+                        top_p=0.8,
+                        top_k=40,
+                        max_output_tokens=2048,
+                    ),
+                    stream=True
+                ))
+                
+                # Stream the reply and stop as soon as the final field has arrived
+                response_text = ""
+                async for chunk in response:
+                    line_start = response_text.rfind('\n') + 1
+                    response_text += chunk.text
+                    if CONTEXT_STORY_END_PATTERN.search(response_text, line_start):
+                        break
             
-            response_text = response.text
-            logger.info(f"💡 Gemini generated response: {response_text[:200]}...")
+            if debug:
+                logger.debug("💡 Gemini generated response: %s...", response_text[:200])
             
             # Parse the response into structured user story
-            story = self._extract_story_from_text(response_text, doc, paragraph_index)
+            story = self._parse_story_from_response(response_text, doc, paragraph_index)
             
             if story:
-                logger.info(f"✅ Successfully extracted story with context")
-                logger.info(f"📋 Story details: {story.get('User Story', 'Unknown')[:50]}...")
+                if debug:
+                    logger.debug("✅ Extracted story with context: %s...", story.get('User Story', 'Unknown')[:50])
             else:
-                logger.warning(f"⚠️ Failed to parse story from Gemini response")
+                logger.warning("⚠️ Failed to parse story from Gemini response")
                 
             return story
             
         except Exception as e:
-            logger.error(f"❌ Error in Gemini AI extraction with context: {str(e)}")
-            logger.info(f"🔄 Falling back to pattern matching...")
-            return self._extract_with_patterns(text, doc, paragraph_index)
+            logger.error("❌ Error in Gemini AI extraction with context, falling back to pattern matching: %s", e)
+            return self._extract_with_patterns_standalone(text, doc, paragraph_index)
     
-    def _extract_story_from_text(self, response_text: str, doc: Dict[str, Any], paragraph_index: int) -> Optional[Dict[str, Any]]:
+    def _parse_story_from_response(self, response_text: str, doc: Dict[str, Any], paragraph_index: int) -> Optional[Dict[str, Any]]:
         """Parse AI response into structured user story"""
         try:
             # Parse the response text to extract user story components
@@ -265,111 +1289,28 @@ PRIORITY RULES: {'; '.join(priority_rules)}
     def _build_extraction_prompt_with_context(self, text: str, doc: Dict[str, Any], paragraph_index: int, context_chunks: List[Dict[str, Any]] = None) -> str:
         """Build the AI extraction prompt with enhanced context from vectorized chunks"""
         
-        # Get construct-specific guidance
-        construct_guidance = self._get_construct_guidance()
-        
-        # Build context information
-        context_info = ""
+        # Static prefix first, then context chunks and the paragraph, assembled in a single join
+        parts = [self._context_prompt_prefix]
         if context_chunks:
-            context_info = "\n\nRELEVANT CONTEXT FROM INTERVIEWS:\n"
+            parts.append("\n\nRELEVANT CONTEXT FROM INTERVIEWS:\n")
             for i, chunk in enumerate(context_chunks):
-                chunk_metadata = chunk.get('metadata', {})
-                filename = chunk_metadata.get('filename', 'Unknown')
-                context_info += f"\nCONTEXT CHUNK {i+1} (from {filename}):\n{chunk['text']}\n"
-            
-            context_info += "\nUse this context to provide more accurate and detailed extraction. Consider the relationships between different parts of the interviews and how they inform the user story."
-        
-        return f"""
-You are an expert business analyst specializing in extracting user stories from interview transcripts. Your task is to analyze the provided text and identify clear, actionable user stories.
-
-ANALYZE THIS TEXT CAREFULLY:
-"{text}"
-
-{context_info}
-
-EXTRACTION GUIDELINES:
-
-1. **ROLE IDENTIFICATION**: Look for who is speaking or who needs the capability
-   - Examples: "workflow manager", "content creator", "system administrator"
-   - Extract stakeholder names and roles when mentioned
-
-2. **CAPABILITY NEEDS**: Identify what the person wants to accomplish
-   - Look for phrases like "I need to", "I want to", "I should be able to"
-   - Focus on business capabilities, not just technical features
-
-3. **BUSINESS VALUE**: Understand why this capability is important
-   - Look for phrases like "so that", "in order to", "because"
-   - Identify efficiency gains, cost savings, compliance needs, etc.
-
-4. **CATEGORIZATION**: Classify the user story appropriately
-   - Workflow: Process improvements, approvals, notifications
-   - DAM: Digital asset management, content organization
-   - Integration: System connections, data flows, APIs
-   - Security: Access control, authentication, compliance
-
-5. **PRIORITY ASSESSMENT**: Determine business priority
-   - HIGH: Critical business functions, security, compliance, revenue impact
-   - MEDIUM: Important operational features, user experience improvements
-   - LOW: Nice-to-have features, minor improvements, future enhancements
-
-{construct_guidance}
-
-OUTPUT FORMAT:
-Generate exactly ONE user story per text segment. Use this exact format:
-
-User Story: [Complete user story in "As a [role], I need [capability] so that [business value]" format]
-Capability: [Specific capability or feature needed]
-Category: [Workflow/DAM/Integration/Security/Other]
-Priority: [HIGH/MEDIUM/LOW]
-Snippet: [Key quote or phrase from the text that supports this story]
-Team: [Team or department mentioned, if any]
-Stakeholder: [Specific person mentioned, if any]
-
-EXAMPLE:
-User Story: As a workflow manager, I need to approve document submissions so that I can ensure quality control and compliance.
-Capability: Document approval workflow
-Category: Workflow
-Priority: HIGH
-Snippet: "I need to approve all submissions before they go live"
-Team: Operations
-Stakeholder: Sarah Johnson
-
-Analyze the text thoroughly and extract the most relevant user story. If no clear user story is present, return null.
-"""
+                filename = chunk.get('metadata', {}).get('filename', 'Unknown')
+                parts.append(f"\nCONTEXT CHUNK {i+1} (from {filename}):\n{chunk['text']}\n")
+            parts.append(CONTEXT_USAGE_INSTRUCTION)
+        parts.append('\n\nANALYZE THIS TEXT CAREFULLY:\n"')
+        parts.append(text)
+        parts.append('"\n')
+        return ''.join(parts)
     
-    def _parse_ai_response(self, ai_response: str, doc: Dict[str, Any], paragraph_index: int) -> Optional[Dict[str, Any]]:
-        """Parse AI response into structured data with consistent validation"""
+    def _parse_ai_response(self, ai_response: str, text: str, doc: Dict[str, Any], paragraph_index: int) -> Optional[Dict[str, Any]]:
+        """Parse a single-story AI response for the given paragraph text into structured data"""
         try:
-            # Try to extract JSON from response
-            json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-            if json_match:
-                story_data = json.loads(json_match.group())
-                
-                # Validate required fields
-                if all(key in story_data for key in ['role', 'capability', 'benefit']):
-                    # Normalize text for consistency
-                    normalized_role = self._normalize_text(story_data.get('role', 'User'))
-                    normalized_capability = self._normalize_text(story_data.get('capability', ''))
-                    normalized_benefit = self._normalize_text(story_data.get('benefit', ''))
-                    
-                    return {
-                        'user_story_id': self._generate_sequential_id(),  # Use sequential ID: US-1, US-2, etc.
-                        'role': normalized_role,
-                        'capability': normalized_capability,
-                        'benefit': normalized_benefit,
-                        'category': story_data.get('category', 'workflow'),
-                        'priority': story_data.get('priority', 'medium'),
-                        'source_text': story_data.get('source_text', ''),
-                        'requirements': story_data.get('requirements', []),
-                        'acceptance_criteria': story_data.get('acceptance_criteria', []),
-                        'source_file': doc['filename'],
-                        'paragraph_index': paragraph_index,
-                        'extraction_method': 'ai',
-                        'confidence_score': 0.8,
-                        'content_hash': self._generate_content_hash(text)
-                    }
+            # Decode the first balanced JSON object, ignoring any preamble or trailing prose
+            story_data = _decode_first_json_object(ai_response)
+            if story_data is not None and all(key in story_data for key in ['role', 'capability', 'benefit']):
+                return self._story_from_ai_data(story_data, text, doc, paragraph_index)
         except Exception as e:
-            print(f"Error parsing AI response: {str(e)}")
+            logger.error(f"❌ Error parsing AI response: {e}")
         
         return None
     
@@ -382,42 +1323,50 @@ Analyze the text thoroughly and extract the most relevant user story. If no clea
         text = text.lower().strip()
         
         # Standardize common terms
-        text = re.sub(r'\b(workflow|process|procedure)\b', 'workflow', text)
-        text = re.sub(r'\b(asset|file|document|media)\b', 'asset', text)
-        text = re.sub(r'\b(approve|approval|sign-off|signoff)\b', 'approval', text)
-        text = re.sub(r'\b(notify|notification|alert|email)\b', 'notification', text)
+        text = NORMALIZED_TERMS_PATTERN.sub(lambda match: NORMALIZED_TERMS[match.group(1)], text)
         
         # Capitalize first letter
         return text.capitalize() if text else ""
     
     def _generate_content_hash(self, text: str) -> str:
         """Generate a hash of the source content for consistency checking"""
-        return hashlib.md5(text.encode()).hexdigest()
+        # Identity only, not security: xxh3 is far faster than md5 with the same 128-bit width
+        return xxhash.xxh3_128_hexdigest(text)
     
-    def _extract_with_patterns(self, text: str, doc: Dict[str, Any], paragraph_index: int) -> Optional[Dict[str, Any]]:
+    def _detect_category(self, text_lower: str) -> str:
+        """Classify lowercased text as workflow, dam, or general by keyword"""
+        categories = {category for _, category in CATEGORY_AUTOMATON.iter(text_lower)}
+        if 'workflow' in categories:
+            return 'workflow'
+        if 'dam' in categories:
+            return 'dam'
+        return 'general'
+    
+    def _extract_with_patterns_standalone(self, text: str, doc: Dict[str, Any], paragraph_index: int) -> Optional[Dict[str, Any]]:
+        """Pattern extraction for single-paragraph callers, with an ID derived from the paragraph's position"""
+        story = self._extract_with_patterns(text, doc, paragraph_index)
+        story['user_story_id'] = f"US-{doc.get('filename', 'unknown')}-{paragraph_index}"
+        return story
+    
+    def _extract_with_patterns(self, text: str, doc: Dict[str, Any], paragraph_index: int, text_lower: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """Fallback extraction using pattern matching with consistent logic"""
-        # Simple pattern-based extraction
-        text_lower = text.lower()
+        # Simple pattern-based extraction; callers that already lowered the text pass it in
+        if text_lower is None:
+            text_lower = text.lower()
         
         # Identify category using consistent logic
-        if any(keyword in text_lower for keyword in ['workflow', 'process', 'approval']):
-            category = 'workflow'
-        elif any(keyword in text_lower for keyword in ['asset', 'digital', 'metadata']):
-            category = 'dam'
-        else:
-            category = 'general'
+        category = self._detect_category(text_lower)
         
         # Extract basic story elements using consistent patterns
-        role_match = re.search(r'as a (\w+)', text_lower)
+        role_match = ROLE_PATTERN.search(text_lower)
         role = role_match.group(1) if role_match else 'User'
         
         # Simple capability extraction
-        capability_keywords = ['need', 'want', 'should', 'must', 'require']
         capability = ''
-        for keyword in capability_keywords:
-            if keyword in text_lower:
+        for keyword in CAPABILITY_KEYWORDS:
+            start_idx = text_lower.find(keyword)
+            if start_idx != -1:
                 # Extract text after the keyword
-                start_idx = text_lower.find(keyword)
                 capability = text[start_idx:start_idx + 100].strip()
                 break
         
@@ -425,7 +1374,7 @@ Analyze the text thoroughly and extract the most relevant user story. If no clea
             capability = text[:100].strip()
         
         return {
-            'user_story_id': self._generate_sequential_id(),  # Use sequential ID: US-1, US-2, etc.
+            'user_story_id': '',  # Assigned once stories are placed in output order
             'role': role,
             'capability': capability,
             'benefit': 'Improved efficiency and user experience',
@@ -441,41 +1390,38 @@ Analyze the text thoroughly and extract the most relevant user story. If no clea
             'content_hash': self._generate_content_hash(text)
         }
     
-    async def _apply_construct_template(self, stories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Apply the construct template to extracted stories with consistent processing"""
-        if not self.construct:
-            return stories
-        
-        structured_stories = []
-        
-        for story in stories:
-            try:
-                structured_story = self._structure_story(story)
-                structured_stories.append(structured_story)
-            except Exception as e:
-                print(f"Error structuring story: {str(e)}")
-                continue
-        
-        return structured_stories
+    def _append_final_story(self, stories: List[Dict[str, Any]], story: Dict[str, Any], story_id: str, doc: Dict[str, Any], text: str):
+        """Append a story in its output shape under story_id, pointed at (doc, text)
+
+        Every story is structured directly into one output dict, construct or not; without a
+        construct the built-in defaults apply, so callers always get the same schema.
+        """
+        try:
+            stories.append(self._structure_story(story, story_id, doc['filename'], self._generate_content_hash(text)))
+        except Exception as e:
+            logger.error(f"❌ Error structuring story: {e}")
     
-    def _structure_story(self, story: Dict[str, Any]) -> Dict[str, Any]:
-        """Structure a story according to the construct template with consistent defaults"""
-        # Apply defaults from construct
-        defaults = self.construct.get('defaults', {})
+    def _structure_story(self, story: Dict[str, Any], story_id: Optional[str] = None, source_file: Optional[str] = None, content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Structure a story according to the construct template with consistent defaults
+
+        story_id, source_file and content_hash override the story's own values when given.
+        """
+        capability = story.get('capability', '')
         
+        # Construct defaults were resolved at init
         structured_story = {
-            'User Story ID': story.get('user_story_id', ''),
-            'User Story': f"As a {story.get('role', 'User')}, I need {story.get('capability', '')} so that {story.get('benefit', '')}",
-            'Team': defaults.get('Team', 'Product'),
-            'Category': story.get('category', defaults.get('Category', 'Workflow')),
-            'Lifecycle Phase': defaults.get('Lifecycle Phase', 'Execution'),
-            'Capability': story.get('capability', ''),
-            'Priority': story.get('priority', defaults.get('Priority', 'Medium')),
-            'Source': story.get('source_file', ''),
+            'User Story ID': story.get('user_story_id', '') if story_id is None else story_id,
+            'User Story': f"As a {story.get('role', 'User')}, I need {capability} so that {story.get('benefit', '')}",
+            'Team': self._default_team,
+            'Category': story.get('category', self._default_category),
+            'Lifecycle Phase': self._default_lifecycle_phase,
+            'Capability': capability,
+            'Priority': story.get('priority', self._default_priority),
+            'Source': story.get('source_file', '') if source_file is None else source_file,
             'Snippet': story.get('source_text', '')[:100] + '...',
             'Match Score': story.get('confidence_score', 0.0),
             'Tags': self._generate_tags(story),
-            'Content Hash': story.get('content_hash', ''),
+            'Content Hash': story.get('content_hash', '') if content_hash is None else content_hash,
             'Extraction Method': story.get('extraction_method', 'unknown')
         }
         
@@ -483,70 +1429,50 @@ Analyze the text thoroughly and extract the most relevant user story. If no clea
     
     def _generate_tags(self, story: Dict[str, Any]) -> List[str]:
         """Generate tags for the story with consistent logic"""
-        tags = []
-        
-        # Add category tag
-        tags.append(story.get('category', 'general'))
-        
-        # Add priority tag
-        tags.append(story.get('priority', 'medium'))
+        # Category and priority tags
+        tags = {story.get('category', 'general'), story.get('priority', 'medium')}
         
         # Add role tag
-        if story.get('role'):
-            tags.append(story.get('role').lower())
-        
-        # Add capability tags using consistent patterns
-        capability = story.get('capability', '').lower()
-        if 'approval' in capability:
-            tags.append('approval')
-        if 'notification' in capability:
-            tags.append('notification')
-        if 'routing' in capability:
-            tags.append('routing')
-        if 'asset' in capability:
-            tags.append('asset-management')
+        role = story.get('role')
+        if role:
+            tags.add(role.lower())
+        
+        # Add capability tags from a single scan
+        tags.update(tag for _, tag in CAPABILITY_TAG_AUTOMATON.iter(story.get('capability', '').lower()))
         
         # Sort tags for consistency
-        return sorted(list(set(tags)))
+        return sorted(tags)
     
     def get_extraction_summary(self, stories: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Generate a summary of extracted stories with consistent metrics"""
         if not stories:
             return {'total_stories': 0, 'status': 'no_stories_extracted'}
         
-        categories = {}
-        priorities = {}
-        extraction_methods = {}
-        
-        for story in stories:
-            # Count categories
-            category = story.get('Category', 'Unknown')
-            categories[category] = categories.get(category, 0) + 1
-            
-            # Count priorities
-            priority = story.get('Priority', 'Unknown')
-            priorities[priority] = priorities.get(priority, 0) + 1
-            
-            # Count extraction methods
-            method = story.get('Extraction Method', 'Unknown')
-            extraction_methods[method] = extraction_methods.get(method, 0) + 1
+        # One pass pulls the summarized fields; Counter and sum then aggregate each column in C
+        categories, priorities, extraction_methods, confidences = zip(*[
+            (
+                story.get('Category', 'Unknown'),
+                story.get('Priority', 'Unknown'),
+                story.get('Extraction Method', 'Unknown'),
+                story.get('Match Score', 0)
+            )
+            for story in stories
+        ])
         
         return {
             'total_stories': len(stories),
-            'category_distribution': categories,
-            'priority_distribution': priorities,
-            'extraction_methods': extraction_methods,
-            'average_confidence': sum(story.get('Match Score', 0) for story in stories) / len(stories),
+            'category_distribution': dict(Counter(categories)),
+            'priority_distribution': dict(Counter(priorities)),
+            'extraction_methods': dict(Counter(extraction_methods)),
+            'average_confidence': sum(confidences) / len(stories),
             'status': 'extraction_completed',
             'consistency_hash': self._generate_batch_hash(stories)
         }
     
     def _generate_batch_hash(self, stories: List[Dict[str, Any]]) -> str:
         """Generate a hash for the entire batch to verify consistency"""
-        # Create a deterministic string from all story IDs and hashes
-        story_identifiers = []
+        # Feed story IDs and content hashes in a deterministic order without building one large string
+        batch_hash = xxhash.xxh3_128()
         for story in sorted(stories, key=lambda x: x.get('User Story ID', '')):
-            story_identifiers.append(f"{story.get('User Story ID', '')}:{story.get('Content Hash', '')}")
-        
-        batch_string = "|".join(story_identifiers)
-        return hashlib.md5(batch_string.encode()).hexdigest()
+            batch_hash.update(f"{story.get('User Story ID', '')}:{story.get('Content Hash', '')}|".encode())
+        return batch_hash.hexdigest()
@@ -1,24 +1,184 @@
 import os
+import re
+import random
+import hashlib
 import logging
+import threading
+import time
 import uuid
-from typing import List, Dict, Any, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import chain
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import numpy as np
+import orjson
+from google.api_core import exceptions as google_exceptions
 from google.generativeai import GenerativeModel
 import google.generativeai as genai
+from .semantic_index import SemanticIndex
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # Optional: without it only exact cache matches are reused
+    SentenceTransformer = None
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+REQUIREMENTS_MODEL = 'gemini-pro'
+REQUIREMENTS_TEMPERATURE = 0.3  # Lower temperature for more consistent output
+
+# Per-job identifiers excluded from the conversion cache key so identical stories hit across jobs
+CACHE_KEY_EXCLUDED_FIELDS = ('id', 'User Story ID')
+# Cached conversions older than this are treated as misses and regenerated
+REQUIREMENTS_CACHE_TTL_SECONDS = 30 * 86400
+# Persisted entries kept on disk; expired and then the oldest entries are deleted in bulk once the cap is exceeded
+REQUIREMENTS_CACHE_MAX_ENTRIES = 20000
+REQUIREMENTS_CACHE_EVICT_TO = 18000
+
+# Semantic cache: a story at least this similar to one already converted (same constructs) reuses its requirements
+SEMANTIC_CACHE_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+SEMANTIC_CACHE_THRESHOLD = 0.92
+# Converted stories remembered per construct scope; the oldest are overwritten beyond this
+SEMANTIC_CACHE_MAX_ENTRIES = 10000
+
+# Uncached stories are converted this many per Gemini request, each story's output under its own delimiter
+REQUIREMENTS_BATCH_SIZE = 8
+REQUIREMENTS_OUTPUT_TOKENS = 800  # Per story (2-4 concise requirements); batched requests scale it up to the model's output limit
+REQUIREMENTS_MAX_OUTPUT_TOKENS = 8192
+STORY_DELIMITER_PATTERN = re.compile(r'^\s*=+\s*STORY\s+(\d+)\s*=+\s*$', re.MULTILINE)
+
+# Transient Gemini errors are retried with jittered exponential backoff starting at GEMINI_RETRY_BASE_DELAY seconds
+TRANSIENT_GEMINI_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+GEMINI_MAX_RETRIES = 4
+GEMINI_RETRY_BASE_DELAY = 1.0
+# After this many consecutive failed Gemini requests, conversion uses patterns for the cooldown instead of calling out
+GEMINI_CIRCUIT_FAILURE_THRESHOLD = 5
+GEMINI_CIRCUIT_COOLDOWN_SECONDS = 60
+
+# One requirement block of the response format; details run until the next REQ-ID line or the end of the text
+REQUIREMENT_BLOCK_PATTERN = re.compile(
+    r'^[ \t]*REQ-ID:[ \t]*(?P<req_id>[^\n]*?)[ \t]*\n\s*'
+    r'REQUIREMENT:[ \t]*(?P<requirement>[^\n]*?)[ \t]*\n\s*'
+    r'PRIORITY:[ \t]*(?P<priority>[^\n]*?)[ \t]*\n\s*'
+    r'REQ-DETAILS:[ \t]*(?P<details>.*?)\s*(?=^[ \t]*REQ-ID:|\Z)',
+    re.MULTILINE | re.DOTALL
+)
+PRIORITY_LEVELS = frozenset({'LOW', 'MEDIUM', 'HIGH'})
+
+# Pattern-fallback priority keywords, matched as substrings of the lowercased story in a single regex pass
+HIGH_PRIORITY_KEYWORDS = ('critical', 'urgent', 'security', 'compliance', 'revenue', 'customer', 'core')
+LOW_PRIORITY_KEYWORDS = ('nice', 'future', 'enhancement', 'optional', 'improvement')
+HIGH_PRIORITY_PATTERN = re.compile('|'.join(HIGH_PRIORITY_KEYWORDS))
+LOW_PRIORITY_PATTERN = re.compile('|'.join(LOW_PRIORITY_KEYWORDS))
+
+# Analysis guidance shared by the single-story and batched requirements prompts
+REQUIREMENTS_ANALYSIS_GUIDELINES = """
+GUIDELINES:
+- Every requirement MUST include ALL fields of the output schema.
+- REQ-ID: descriptive, hierarchical identifier (e.g., "REQ-001", "REQ-AUTH-001").
+- REQUIREMENT: the core business need - what the system must do, for whom, and the value it delivers.
+- PRIORITY: apply the priority rules above if given; otherwise HIGH for critical, security, compliance, revenue or customer-facing needs, MEDIUM for operational, usability or efficiency gains, LOW for nice-to-have or future work.
+- REQ-DETAILS: acceptance criteria, business rules, non-functional needs and integration points in at most 120 words.
+"""
+
+REQUIREMENTS_QUALITY_CHECKLIST = """
+Requirements must be clear, testable, technically feasible and EXACTLY match the output schema.
+"""
+
+# Prompt templates, filled with str.format; substituted story text is never itself parsed for fields.
+# Static instructions come first and per-story content last.
+REQUIREMENTS_PROMPT_TEMPLATE = """
+You are an expert business analyst and requirements engineer. Generate actionable requirements for the user story at the end of this prompt.
+{construct_context}
+{guidelines}
+OUTPUT FORMAT:
+Generate 2-4 requirements. For each requirement, use this exact format matching the output schema:
+
+{output_format}
+{checklist}
+USER STORY: "{story_text}"
+- Capability: {capability}
+- Team: {team}
+- Category: {category}
+- Technical Context: {snippet}
+{vectorized_context}"""
+
+BATCH_REQUIREMENTS_PROMPT_TEMPLATE = """
+You are an expert business analyst and requirements engineer. Analyze EACH of the numbered user stories at the end of this prompt independently and generate actionable requirements for every one of them.
+{construct_context}
+{guidelines}
+OUTPUT FORMAT:
+For each user story, first repeat its delimiter line exactly (for example "=== STORY 1 ==="), then generate 2-4 requirements for that story. For each requirement, use this exact format matching the output schema:
+
+{output_format}
+{checklist}
+USER STORIES:
+{story_sections}"""
+
+BATCH_STORY_SECTION_TEMPLATE = """
+=== STORY {position} ===
+USER STORY: "{story_text}"
+- Capability: {capability}
+- Team: {team}
+- Category: {category}
+- Technical Context: {snippet}
+{vectorized_context}"""
+
 class RequirementsConverter:
     """Convert user stories into structured requirements using advanced Gemini AI analysis"""
     
-    def __init__(self, gemini_api_key: Optional[str] = None, requirements_construct: Optional[Dict[str, Any]] = None):
+    def __init__(self, gemini_api_key: Optional[str] = None, requirements_construct: Optional[Dict[str, Any]] = None, cache_dir: Optional[str] = None, max_concurrency: Optional[int] = None, generation_overrides: Optional[Dict[str, Any]] = None):
         self.gemini_model = None
         self.requirements_construct = requirements_construct
+        # Gemini calls are network-bound, so story batches run on this many threads at once
+        self.max_concurrency = max_concurrency or int(os.getenv('GEMINI_CONCURRENCY', '8'))
+        self.cache_dir = cache_dir or os.getenv('REQ_CACHE_DIR', 'requirements_cache')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        
+        # Batch threads save concurrently, so the on-disk entry count is guarded by a lock
+        self._disk_cache_lock = threading.Lock()
+        self._disk_cache_entries = self._evict_cached_requirements()
+        
+        # The output format only depends on the requirements construct, so it is built once per converter
+        self._output_format_instructions = self._build_output_format_instructions()
+        
+        # One generation config per batch size, built once; the single-story path uses the size-1 config
+        generation_settings = {'temperature': REQUIREMENTS_TEMPERATURE, 'top_p': 0.8, 'top_k': 40, **(generation_overrides or {})}
+        self._generation_configs = {
+            size: genai.types.GenerationConfig(
+                **{'max_output_tokens': min(REQUIREMENTS_OUTPUT_TOKENS * size, REQUIREMENTS_MAX_OUTPUT_TOKENS), **generation_settings}
+            )
+            for size in range(1, REQUIREMENTS_BATCH_SIZE + 1)
+        }
+        
+        # Cache entries are only valid for the model, sampling settings and prompt text that produced them
+        prompt_version = hashlib.sha256(''.join((
+            REQUIREMENTS_PROMPT_TEMPLATE, BATCH_REQUIREMENTS_PROMPT_TEMPLATE, BATCH_STORY_SECTION_TEMPLATE,
+            REQUIREMENTS_ANALYSIS_GUIDELINES, REQUIREMENTS_QUALITY_CHECKLIST, self._output_format_instructions
+        )).encode()).hexdigest()
+        sampling = orjson.dumps(generation_settings, option=orjson.OPT_SORT_KEYS).decode()
+        self._cache_namespace = f"{REQUIREMENTS_MODEL}:{sampling}:{prompt_version}"
+        
+        # In-memory semantic cache per construct scope, mapping story embeddings to their requirements.
+        # Batches convert on worker threads, so the model and index are guarded by a lock.
+        self._embedding_model = None
+        self._semantic_cache: Dict[str, SemanticIndex] = {}
+        self._semantic_lock = threading.Lock()
+        
+        # Circuit breaker over Gemini requests, shared by all batch threads
+        self._failure_streak = 0
+        self._circuit_open_until = 0.0
+        self._circuit_lock = threading.Lock()
         
         if gemini_api_key:
             try:
                 genai.configure(api_key=gemini_api_key)
-                self.gemini_model = GenerativeModel('gemini-pro')
+                self.gemini_model = GenerativeModel(REQUIREMENTS_MODEL)
                 logger.info("🚀 Requirements converter initialized with Gemini AI - Ready for intelligent analysis!")
                 if requirements_construct:
                     logger.info(f"📋 Using requirements construct: {requirements_construct.get('name', 'Unknown')} with {len(requirements_construct.get('output_schema', []))} fields")
@@ -33,85 +193,412 @@ class RequirementsConverter:
         if not self.gemini_model:
             logger.warning("⚠️ Gemini AI not available - falling back to basic pattern matching")
             return self._convert_with_patterns_batch(user_stories)
+        if self._circuit_open():
+            logger.warning("⚠️ Gemini circuit breaker open after repeated failures - falling back to basic pattern matching")
+            return self._convert_with_patterns_batch(user_stories)
         
         logger.info(f"🤖 Gemini AI analyzing {len(user_stories)} user stories for requirements conversion...")
         logger.info(f"📊 User stories construct: {user_stories_construct.get('name', 'Unknown') if user_stories_construct else 'None'}")
         logger.info(f"📋 Requirements construct: {self.requirements_construct.get('name', 'Unknown') if self.requirements_construct else 'None'}")
         logger.info(f"🧠 Vectorized context: {len(vectorized_chunks) if vectorized_chunks else 0} chunks available")
         
-        requirements = []
+        # Cached stories are reused and blank ones skipped before any Gemini work; the rest are converted in batches
+        requirements_by_story: List[List[Dict[str, Any]]] = [[] for _ in user_stories]
+        misses = []
+        for i, story in enumerate(user_stories):
+            if not story.get('User Story', '').strip():
+                continue
+            
+            cache_key = self._story_cache_key(story, user_stories_construct)
+            cached_requirements = self._load_cached_requirements(cache_key, story)
+            if cached_requirements is not None:
+                requirements_by_story[i] = cached_requirements
+                continue
+            misses.append((i, story, cache_key))
         
-        for i, story in enumerate(user_stories, 1):
-            try:
-                logger.info(f"📋 Processing story {i}/{len(user_stories)}: {story.get('User Story', 'Unknown')[:50]}...")
-                
-                # Get relevant context chunks for this story
-                context_chunks = []
-                if vectorized_chunks:
-                    context_chunks = self._get_context_for_story(story, vectorized_chunks)
-                    logger.info(f"🔍 Found {len(context_chunks)} relevant context chunks for story {i}")
-                
-                # Use Gemini to intelligently convert the story using both constructs and context
-                story_requirements = self._convert_with_gemini_intelligence(story, user_stories_construct, context_chunks)
-                requirements.extend(story_requirements)
-                
-                logger.info(f"✅ Story {i} converted to {len(story_requirements)} requirements")
-                
-            except Exception as e:
-                logger.error(f"❌ Error converting story {i}: {e}")
-                # Fallback to pattern-based conversion for this story
-                fallback_reqs = self._convert_with_patterns(story)
-                requirements.extend(fallback_reqs)
-                logger.info(f"🔄 Used fallback conversion for story {i}")
+        # Exact misses may still be close paraphrases of a story converted earlier under the same constructs
+        semantic_scope = self._semantic_cache_scope(user_stories_construct)
+        embeddings = self._embed_stories([story for _, story, _ in misses])
+        pending = []
+        for position, (i, story, cache_key) in enumerate(misses):
+            embedding = embeddings[position] if embeddings is not None else None
+            similar_requirements = self._lookup_similar_requirements(semantic_scope, embedding, story)
+            if similar_requirements is not None:
+                requirements_by_story[i] = similar_requirements
                 continue
+            
+            # Get relevant context chunks for this story
+            context_chunks = self._get_context_for_story(story, vectorized_chunks) if vectorized_chunks else []
+            pending.append((i, story, context_chunks, cache_key, embedding))
+        
+        logger.info(f"♻️ {len(user_stories) - len(pending)} stories served from cache or skipped, {len(pending)} to convert")
         
+        # Batches run concurrently; each result lands in its stories' slots, so output order is unchanged
+        batches = [pending[start:start + REQUIREMENTS_BATCH_SIZE] for start in range(0, len(pending), REQUIREMENTS_BATCH_SIZE)]
+        if batches:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                batch_futures = {executor.submit(self._convert_story_batch, batch, user_stories_construct, semantic_scope): batch for batch in batches}
+                fallback_futures = {}
+                while batch_futures or fallback_futures:
+                    done, _ = wait([*batch_futures, *fallback_futures], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future in fallback_futures:
+                            requirements_by_story[fallback_futures.pop(future)] = future.result()
+                            continue
+                        for (i, story, context_chunks, cache_key, _), story_requirements in zip(batch_futures.pop(future), future.result()):
+                            if story_requirements is None:
+                                # Missing from the batched reply - converted on its own, overlapping the remaining batches
+                                fallback = executor.submit(self._convert_with_gemini_intelligence, story, user_stories_construct, context_chunks, cache_key)
+                                fallback_futures[fallback] = i
+                            else:
+                                requirements_by_story[i] = story_requirements
+        
+        requirements = list(chain.from_iterable(requirements_by_story))
         logger.info(f"🎯 Gemini AI successfully generated {len(requirements)} total requirements!")
         return requirements
     
-    def _convert_with_gemini_intelligence(self, story: Dict[str, Any], user_stories_construct: Optional[Dict[str, Any]] = None, context_chunks: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
-        """Use Gemini AI to intelligently analyze and convert user stories to requirements"""
+    def _convert_story_batch(self, batch: List[tuple], user_stories_construct: Optional[Dict[str, Any]] = None, semantic_scope: Optional[str] = None) -> List[Optional[List[Dict[str, Any]]]]:
+        """Convert one batch of pending stories and cache the results; None marks a story missing from the reply, which needs the single-story fallback"""
+        try:
+            batch_requirements = self._convert_batch_with_gemini(batch, user_stories_construct)
+        except Exception as e:
+            # The request already used its retries or hit the open breaker; per-story retries would only add load
+            logger.error(f"❌ Batched conversion of {len(batch)} stories failed, using basic patterns: {e}")
+            return [self._convert_with_patterns(story) for _, story, *_ in batch]
+        
+        results = []
+        for (_, _, _, cache_key, embedding), story_requirements in zip(batch, batch_requirements):
+            if story_requirements:
+                self._save_cached_requirements(cache_key, story_requirements)
+                self._remember_similar_requirements(semantic_scope, embedding, story_requirements)
+            results.append(story_requirements or None)
+        return results
+    
+    def _convert_batch_with_gemini(self, batch: List[tuple], user_stories_construct: Optional[Dict[str, Any]] = None) -> List[Optional[List[Dict[str, Any]]]]:
+        """Convert several (index, story, context_chunks, cache_key, embedding) entries with one Gemini call; None marks a story missing from the reply"""
+        prompt = self._build_batch_requirements_prompt([(story, context_chunks) for _, story, context_chunks, *_ in batch], user_stories_construct)
+        
+        logger.debug("🧠 Gemini analyzing a batch of %d stories...", len(batch))
+        
+        def stream_and_parse() -> List[Optional[List[Dict[str, Any]]]]:
+            response = self.gemini_model.generate_content(
+                prompt,
+                generation_config=self._generation_configs[len(batch)],
+                stream=True
+            )
+            # Each story is parsed as soon as its section completes, while later stories are still streaming
+            results: List[Optional[List[Dict[str, Any]]]] = [None] * len(batch)
+            for number, section in self._stream_story_sections(response):
+                if number is not None and 1 <= number <= len(batch) and section.strip():
+                    results[number - 1] = self._parse_intelligent_requirements_response(section, batch[number - 1][1], self.requirements_construct)
+            return results
+        
+        # The stream is drained inside the retried call, so a mid-stream failure is retried and counted by the breaker
+        return self._send_gemini_request(stream_and_parse)
+    
+    def _send_gemini_request(self, make_request):
+        """Send a Gemini request, retrying transient errors with jittered exponential backoff and feeding the circuit breaker
+
+        make_request must fully consume a streamed response before returning; success is recorded when it returns.
+        """
+        if self._circuit_open():
+            raise RuntimeError("Gemini circuit breaker is open")
+        
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            try:
+                response = make_request()
+            except TRANSIENT_GEMINI_ERRORS as e:
+                if attempt == GEMINI_MAX_RETRIES:
+                    self._record_gemini_result(success=False)
+                    raise
+                # Jitter keeps concurrent batch threads from retrying in lockstep
+                delay = GEMINI_RETRY_BASE_DELAY * 2 ** attempt * random.uniform(0.5, 1.5)
+                logger.warning(f"⏳ Gemini request failed transiently, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+            except Exception:
+                self._record_gemini_result(success=False)
+                raise
+            else:
+                self._record_gemini_result(success=True)
+                return response
+    
+    def _record_gemini_result(self, success: bool):
+        """Reset the failure streak on success; open the circuit once consecutive failures reach the threshold"""
+        with self._circuit_lock:
+            if success:
+                self._failure_streak = 0
+                return
+            self._failure_streak += 1
+            if self._failure_streak >= GEMINI_CIRCUIT_FAILURE_THRESHOLD:
+                self._circuit_open_until = time.monotonic() + GEMINI_CIRCUIT_COOLDOWN_SECONDS
+                self._failure_streak = 0
+                logger.error(f"🔌 Gemini failed {GEMINI_CIRCUIT_FAILURE_THRESHOLD} times in a row - using patterns for {GEMINI_CIRCUIT_COOLDOWN_SECONDS}s")
+    
+    def _circuit_open(self) -> bool:
+        """Whether Gemini requests are currently short-circuited"""
+        return time.monotonic() < self._circuit_open_until
+    
+    def _stream_story_sections(self, response) -> Iterator[Tuple[Optional[int], str]]:
+        """Yield (story number, section text) from a streamed batched reply as each section completes
+        
+        A section is complete once the next delimiter line has fully arrived; text before the first delimiter has number None.
+        """
+        buffer = ""
+        section_start = 0
+        section_number = None
+        for chunk in response:
+            buffer += chunk.text
+            for match in STORY_DELIMITER_PATTERN.finditer(buffer, section_start):
+                if match.end() == len(buffer):
+                    break  # The delimiter line may still be arriving
+                yield section_number, buffer[section_start:match.start()]
+                section_number, section_start = int(match.group(1)), match.end()
+        
+        for match in STORY_DELIMITER_PATTERN.finditer(buffer, section_start):
+            yield section_number, buffer[section_start:match.start()]
+            section_number, section_start = int(match.group(1)), match.end()
+        yield section_number, buffer[section_start:]
+    
+    def _convert_with_gemini_intelligence(self, story: Dict[str, Any], user_stories_construct: Optional[Dict[str, Any]] = None, context_chunks: Optional[List[Dict[str, Any]]] = None, cache_key: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Use Gemini AI to intelligently analyze and convert user stories to requirements
+
+        A cache_key means the caller already missed the cache for this story, so the lookup is skipped.
+        """
         try:
             # Extract story content
             story_text = story.get('User Story', '')
-            capability = story.get('Capability', '')
-            snippet = story.get('Snippet', '')
-            team = story.get('Team', '')
-            category = story.get('Category', '')
-            
-            if not story_text:
+            if not story_text.strip():
                 return []
             
+            # Per-story traces are debug-only; skip building their previews when that level is off
+            debug = logger.isEnabledFor(logging.DEBUG)
+            
+            # Reuse requirements from a previous conversion of the same story
+            if cache_key is None:
+                cache_key = self._story_cache_key(story, user_stories_construct)
+                cached_requirements = self._load_cached_requirements(cache_key, story)
+                if cached_requirements is not None:
+                    if debug:
+                        logger.debug("♻️ Reusing cached requirements for: %s...", story_text[:100])
+                    return cached_requirements
+            
             # Build advanced AI prompt for intelligent requirements analysis
-            prompt = self._build_intelligent_requirements_prompt(story_text, capability, snippet, team, category, user_stories_construct, context_chunks)
+            prompt = self._build_intelligent_requirements_prompt(
+                story_text, story.get('Capability', ''), story.get('Snippet', ''), story.get('Team', ''), story.get('Category', ''),
+                user_stories_construct, context_chunks
+            )
             
-            logger.info(f"🧠 Gemini analyzing: {story_text[:100]}...")
+            if debug:
+                logger.debug("🧠 Gemini analyzing: %s...", story_text[:100])
             
             # Generate requirements using Gemini with enhanced configuration
-            response = self.gemini_model.generate_content(
+            response = self._send_gemini_request(lambda: self.gemini_model.generate_content(
                 prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.3,  # Lower temperature for more consistent output
-                    top_p=0.8,
-                    top_k=40,
-                    max_output_tokens=2048,
-                )
-            )
+                generation_config=self._generation_configs[1]
+            ))
             
             requirements_text = response.text
-            logger.info(f"💡 Gemini generated response: {requirements_text[:200]}...")
+            if debug:
+                logger.debug("💡 Gemini generated response: %s...", requirements_text[:200])
             
             # Parse the AI response into structured requirements
             requirements = self._parse_intelligent_requirements_response(requirements_text, story, self.requirements_construct)
             
+            if requirements:
+                self._save_cached_requirements(cache_key, requirements)
+            
             return requirements
             
         except Exception as e:
             logger.error(f"⚠️ Gemini AI conversion failed: {e}")
             return self._convert_with_patterns(story)
     
+    def _story_cache_key(self, story: Dict[str, Any], user_stories_construct: Optional[Dict[str, Any]] = None) -> str:
+        """Generate a cache key from the canonicalized story, both constructs and the model/prompt namespace"""
+        canonical_story = {k: v for k, v in story.items() if k not in CACHE_KEY_EXCLUDED_FIELDS}
+        key_data = {
+            'namespace': self._cache_namespace,
+            'story': canonical_story,
+            'user_stories_construct': user_stories_construct or {},
+            'requirements_construct': self.requirements_construct or {}
+        }
+        key_bytes = orjson.dumps(key_data, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+        return hashlib.sha256(key_bytes).hexdigest()
+    
+    def _load_cached_requirements(self, cache_key: str, story: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Load cached requirements and point them at the current story"""
+        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
+        try:
+            if time.time() - os.path.getmtime(cache_file) > REQUIREMENTS_CACHE_TTL_SECONDS:
+                return None
+        except OSError:
+            return None
+        
+        try:
+            with open(cache_file, 'rb') as f:
+                requirements = orjson.loads(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Ignoring unreadable requirements cache entry {cache_key}: {e}")
+            return None
+        
+        source_story_id = story.get('id') or uuid.uuid4().hex
+        for requirement in requirements:
+            requirement['source_story_id'] = source_story_id
+        return requirements
+    
+    def _save_cached_requirements(self, cache_key: str, requirements: List[Dict[str, Any]]):
+        """Persist converted requirements for future runs"""
+        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
+        is_new = not os.path.exists(cache_file)
+        try:
+            with open(cache_file, 'wb') as f:
+                f.write(orjson.dumps(requirements, option=orjson.OPT_SORT_KEYS))
+        except (OSError, TypeError) as e:
+            logger.warning(f"⚠️ Failed to write requirements cache entry {cache_key}: {e}")
+            return
+        
+        if is_new:
+            with self._disk_cache_lock:
+                self._disk_cache_entries += 1
+                if self._disk_cache_entries > REQUIREMENTS_CACHE_MAX_ENTRIES:
+                    self._disk_cache_entries = self._evict_cached_requirements()
+    
+    def _evict_cached_requirements(self) -> int:
+        """Delete expired entries, then the oldest ones once over the cap; returns the number of entries kept"""
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if now - mtime > REQUIREMENTS_CACHE_TTL_SECONDS:
+                self._remove_cache_file(entry.path)
+            else:
+                entries.append((mtime, entry.path))
+        
+        if len(entries) > REQUIREMENTS_CACHE_MAX_ENTRIES:
+            entries.sort()
+            excess = len(entries) - REQUIREMENTS_CACHE_EVICT_TO
+            for _, path in entries[:excess]:
+                self._remove_cache_file(path)
+            entries = entries[excess:]
+        return len(entries)
+    
+    def _remove_cache_file(self, path: str) -> bool:
+        """Delete one persisted entry; returns whether it was removed"""
+        try:
+            os.remove(path)
+            return True
+        except OSError as e:
+            logger.warning(f"⚠️ Failed to remove requirements cache entry {os.path.basename(path)}: {e}")
+            return False
+    
+    def _semantic_cache_scope(self, user_stories_construct: Optional[Dict[str, Any]] = None) -> str:
+        """Semantic cache partition: only stories converted under the same constructs and prompt namespace are comparable"""
+        scope_data = {
+            'namespace': self._cache_namespace,
+            'user_stories_construct': user_stories_construct or {},
+            'requirements_construct': self.requirements_construct or {}
+        }
+        return hashlib.sha256(orjson.dumps(scope_data, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)).hexdigest()
+    
+    def _embed_stories(self, stories: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Embed stories for semantic cache lookups in one call, or None when no embedding model is available"""
+        if not stories or SentenceTransformer is None:
+            return None
+        with self._semantic_lock:
+            if self._embedding_model is None:
+                try:
+                    self._embedding_model = SentenceTransformer(SEMANTIC_CACHE_MODEL)
+                except Exception as e:
+                    logger.warning(f"⚠️ Failed to load semantic cache embedding model: {e}")
+                    return None
+        texts = [f"{story.get('User Story', '')} {story.get('Capability', '')}" for story in stories]
+        return self._embedding_model.encode(texts, normalize_embeddings=True)
+    
+    def _lookup_similar_requirements(self, semantic_scope: str, embedding: Optional[np.ndarray], story: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Clone the requirements of the most similar converted story, with fresh IDs pointing at this story"""
+        if embedding is None:
+            return None
+        with self._semantic_lock:
+            index = self._semantic_cache.get(semantic_scope)
+            match = index.most_similar(embedding) if index is not None else None
+        if match is None or match[0] < SEMANTIC_CACHE_THRESHOLD:
+            return None
+        requirements = match[1]
+        
+        source_story_id = story.get('id') or uuid.uuid4().hex
+        return [
+            {**requirement, 'req_id': f"REQ-{uuid.uuid4().hex[:8].upper()}", 'source_story_id': source_story_id}
+            for requirement in requirements
+        ]
+    
+    def _remember_similar_requirements(self, semantic_scope: Optional[str], embedding: Optional[np.ndarray], requirements: List[Dict[str, Any]]):
+        """Add a converted story's embedding and requirements to the semantic cache"""
+        if semantic_scope is None or embedding is None:
+            return
+        with self._semantic_lock:
+            if semantic_scope not in self._semantic_cache:
+                self._semantic_cache[semantic_scope] = SemanticIndex(SEMANTIC_CACHE_MAX_ENTRIES)
+            self._semantic_cache[semantic_scope].add(embedding, requirements)
+    
+    def clear_cache(self) -> int:
+        """Remove every cached conversion; returns the number of entries removed"""
+        with self._semantic_lock:
+            self._semantic_cache.clear()
+        
+        removed = 0
+        with self._disk_cache_lock:
+            for filename in os.listdir(self.cache_dir):
+                if filename.endswith('.json') and self._remove_cache_file(os.path.join(self.cache_dir, filename)):
+                    removed += 1
+            self._disk_cache_entries = 0
+        logger.info(f"🧹 Cleared {removed} cached requirements conversions")
+        return removed
+    
     def _build_intelligent_requirements_prompt(self, story_text: str, capability: str, snippet: str, team: str, category: str, user_stories_construct: Optional[Dict[str, Any]] = None, context_chunks: Optional[List[Dict[str, Any]]] = None) -> str:
         """Build an intelligent AI prompt for advanced requirements analysis using both constructs"""
+        return REQUIREMENTS_PROMPT_TEMPLATE.format(
+            story_text=story_text,
+            capability=capability,
+            team=team,
+            category=category,
+            snippet=snippet,
+            construct_context=self._build_construct_context(user_stories_construct),
+            vectorized_context=self._build_vectorized_context(context_chunks),
+            guidelines=REQUIREMENTS_ANALYSIS_GUIDELINES,
+            output_format=self._output_format_instructions,
+            checklist=REQUIREMENTS_QUALITY_CHECKLIST
+        )
+
+    def _build_batch_requirements_prompt(self, stories: List[tuple], user_stories_construct: Optional[Dict[str, Any]] = None) -> str:
+        """Build one prompt covering several (story, context_chunks) pairs, numbered STORY 1..N"""
+        story_sections = ''.join(
+            BATCH_STORY_SECTION_TEMPLATE.format(
+                position=position,
+                story_text=story.get('User Story', ''),
+                capability=story.get('Capability', ''),
+                team=story.get('Team', ''),
+                category=story.get('Category', ''),
+                snippet=story.get('Snippet', ''),
+                vectorized_context=self._build_vectorized_context(context_chunks)
+            )
+            for position, (story, context_chunks) in enumerate(stories, 1)
+        )
         
+        return BATCH_REQUIREMENTS_PROMPT_TEMPLATE.format(
+            construct_context=self._build_construct_context(user_stories_construct),
+            guidelines=REQUIREMENTS_ANALYSIS_GUIDELINES,
+            output_format=self._output_format_instructions,
+            checklist=REQUIREMENTS_QUALITY_CHECKLIST,
+            story_sections=story_sections
+        )
+
+    def _build_construct_context(self, user_stories_construct: Optional[Dict[str, Any]] = None) -> str:
+        """Describe the user stories and requirements constructs for the prompt"""
         # Build user stories construct context
         user_stories_context = ""
         if user_stories_construct:
@@ -135,87 +622,25 @@ REQUIREMENTS CONSTRUCT CONTEXT:
 - Priority Rules: {'; '.join(self.requirements_construct.get('priority_rules', []))}
 """
         
-        # Build vectorized context context
-        vectorized_context_context = ""
-        if context_chunks:
-            vectorized_context_context = f"""
+        return f"{user_stories_context}\n{requirements_context}"
+
+    def _build_vectorized_context(self, context_chunks: Optional[List[Dict[str, Any]]] = None) -> str:
+        """Describe a story's relevant vectorized chunks for the prompt"""
+        if not context_chunks:
+            return ""
+        
+        vectorized_context = f"""
 VECTORIZED CONTEXT:
 - Chunks: {len(context_chunks)}
 - Example Chunks:
 """
-            for i, chunk in enumerate(context_chunks[:3]): # Show first 3 chunks for context
-                vectorized_context_context += f"""
+        for i, chunk in enumerate(context_chunks[:3]): # Show first 3 chunks for context
+            vectorized_context += f"""
   Chunk {i+1}:
   - Text: {chunk.get('text', 'N/A')}
   - Embedding: {len(chunk.get('embedding', []))} dimensions
 """
-        
-        return f"""
-You are an expert business analyst and requirements engineer with deep expertise in software development, business processes, and system architecture. Your task is to analyze the provided user story and generate comprehensive, actionable requirements using advanced analysis techniques.
-
-USER STORY ANALYSIS:
-"{story_text}"
-
-CONTEXTUAL INFORMATION:
-- Capability: {capability}
-- Team: {team}
-- Category: {category}
-- Technical Context: {snippet}
-
-{user_stories_context}
-
-{requirements_context}
-
-{vectorized_context_context}
-
-ANALYSIS APPROACH:
-1. **Business Impact Analysis**: Identify the business value, stakeholders, and success metrics
-2. **Functional Decomposition**: Break down the user story into logical functional components
-3. **Non-Functional Requirements**: Consider performance, security, scalability, usability
-4. **Dependency Mapping**: Identify technical and business dependencies
-5. **Risk Assessment**: Evaluate implementation complexity and potential challenges
-
-REQUIREMENTS GENERATION GUIDELINES:
-
-**OUTPUT SCHEMA**: You MUST generate requirements that match the exact output schema defined above. Each requirement should include ALL required fields.
-
-**REQ-ID**: Create descriptive, hierarchical identifiers (e.g., "REQ-001", "REQ-AUTH-001")
-
-**HIGH-LEVEL REQUIREMENT**: Extract the core business need, focusing on:
-- What the system must accomplish
-- Who the primary users are
-- What business value it delivers
-- How it fits into the overall system architecture
-
-**PRIORITY LEVEL**: Use the priority rules defined above to determine priority:
-- HIGH: Critical business functions, security, compliance, revenue impact, customer-facing features
-- MEDIUM: Important operational features, user experience improvements, efficiency gains
-- LOW: Nice-to-have features, future enhancements, minor improvements
-
-**REQUIREMENT DETAILS**: Provide comprehensive specification including:
-- Functional requirements with clear acceptance criteria
-- Non-functional requirements (performance, security, usability, scalability)
-- Business rules and validation logic
-- Integration points and data flows
-- User interface and experience requirements
-- Testing and quality assurance requirements
-- Implementation constraints and assumptions
-
-OUTPUT FORMAT:
-Generate 2-4 requirements per user story. For each requirement, use this exact format matching the output schema:
-
-{self._build_output_format_instructions()}
-
-Use your expertise to analyze the user story thoroughly and generate requirements that are:
-- Clear and unambiguous
-- Testable and measurable
-- Aligned with business objectives
-- Technically feasible
-- Comprehensive yet focused
-- EXACTLY matching the defined output schema
-
-Focus on creating requirements that developers can implement and testers can validate.
-"""
+        return vectorized_context
 
     def _build_output_format_instructions(self) -> str:
         """Build the output format instructions based on the requirements construct"""
@@ -242,72 +667,43 @@ REQ-DETAILS: [comprehensive specification with acceptance criteria]
     
     def _parse_intelligent_requirements_response(self, response_text: str, source_story: Dict[str, Any], requirements_construct: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """Parse the intelligent AI response into structured requirements"""
+        source_story_id = source_story.get('id') or uuid.uuid4().hex
         requirements = []
-        current_req = {}
         
-        lines = response_text.strip().split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            if line.startswith('REQ-ID:'):
-                # Save previous requirement if exists and complete
-                if current_req and len(current_req) >= 4:
-                    current_req['source_story_id'] = source_story.get('id', str(uuid.uuid4()))
-                    requirements.append(current_req.copy())
-                
-                # Start new requirement
-                current_req = {'req_id': line.replace('REQ-ID:', '').strip()}
-                
-            elif line.startswith('REQUIREMENT:'):
-                current_req['requirement'] = line.replace('REQUIREMENT:', '').strip()
-                
-            elif line.startswith('PRIORITY:'):
-                priority = line.replace('PRIORITY:', '').strip().upper()
-                # Normalize priority values
-                if priority in ['LOW', 'MEDIUM', 'HIGH']:
-                    current_req['priority_level'] = priority
-                else:
-                    current_req['priority_level'] = 'MEDIUM'  # Default
-                    
-            elif line.startswith('REQ-DETAILS:'):
-                current_req['req_details'] = line.replace('REQ-DETAILS:', '').strip()
-        
-        # Add the last requirement
-        if current_req and len(current_req) >= 4:
-            current_req['source_story_id'] = source_story.get('id', str(uuid.uuid4()))
-            requirements.append(current_req)
+        for match in REQUIREMENT_BLOCK_PATTERN.finditer(response_text):
+            priority = match.group('priority').upper()
+            requirements.append({
+                'req_id': match.group('req_id'),
+                'requirement': match.group('requirement'),
+                'priority_level': priority if priority in PRIORITY_LEVELS else 'MEDIUM',  # Normalize priority values
+                'req_details': match.group('details'),
+                'source_story_id': source_story_id
+            })
         
         return requirements
     
     def _convert_with_patterns_batch(self, user_stories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Batch pattern-based conversion when AI is not available"""
-        requirements = []
-        
-        for story in user_stories:
-            story_reqs = self._convert_with_patterns(story)
-            requirements.extend(story_reqs)
-        
-        return requirements
+        return list(chain.from_iterable(map(self._convert_with_patterns, user_stories)))
     
     def _convert_with_patterns(self, story: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Fallback pattern-based conversion when AI is not available"""
         story_text = story.get('User Story', '')
         capability = story.get('Capability', '')
         
-        if not story_text:
+        if not story_text.strip():
             return []
         
-        # Generate a simple requirement based on patterns
-        req_id = f"REQ-{str(uuid.uuid4())[:8].upper()}"
+        # Generate a simple requirement based on patterns; one UUID supplies both the req_id and any missing story id
+        story_uuid = uuid.uuid4().hex
+        req_id = f"REQ-{story_uuid[:8].upper()}"
         
         # Determine priority based on keywords
+        story_lower = story_text.lower()
         priority = 'MEDIUM'  # Default
-        if any(word in story_text.lower() for word in ['critical', 'urgent', 'security', 'compliance', 'revenue', 'customer', 'core']):
+        if HIGH_PRIORITY_PATTERN.search(story_lower):
             priority = 'HIGH'
-        elif any(word in story_text.lower() for word in ['nice', 'future', 'enhancement', 'optional', 'improvement']):
+        elif LOW_PRIORITY_PATTERN.search(story_lower):
             priority = 'LOW'
         
         # Create requirement
@@ -316,7 +712,7 @@ REQ-DETAILS: [comprehensive specification with acceptance criteria]
             'requirement': f"Implement {capability.lower() if capability else 'user story functionality'}",
             'priority_level': priority,
             'req_details': f"Convert user story: {story_text[:100]}...",
-            'source_story_id': story.get('id', str(uuid.uuid4()))
+            'source_story_id': story.get('id') or story_uuid
         }
         
         return [requirement]
@@ -0,0 +1,51 @@
+from typing import Any, List, Optional, Tuple
+import numpy as np
+
+# Rows preallocated on the first insert; capacity doubles from here up to max_entries
+SEMANTIC_INDEX_INITIAL_CAPACITY = 64
+
+class SemanticIndex:
+    """Bounded nearest-neighbour index over normalized embeddings, each row carrying a value
+
+    Rows live in a preallocated matrix that grows geometrically, so inserts are amortized O(1)
+    instead of copying the whole matrix each time. Once max_entries rows are held, new entries
+    overwrite the oldest ones.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._embeddings: Optional[np.ndarray] = None
+        self._values: List[Any] = []
+        self._count = 0
+        self._next_row = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, embedding: np.ndarray, value: Any):
+        """Insert an embedding and its value, evicting the oldest entry when full"""
+        if self._embeddings is None:
+            capacity = min(SEMANTIC_INDEX_INITIAL_CAPACITY, self.max_entries)
+            self._embeddings = np.empty((capacity, embedding.shape[0]), dtype=embedding.dtype)
+        elif self._next_row == len(self._embeddings) and len(self._embeddings) < self.max_entries:
+            grown = np.empty((min(2 * len(self._embeddings), self.max_entries), self._embeddings.shape[1]), dtype=self._embeddings.dtype)
+            grown[:self._count] = self._embeddings[:self._count]
+            self._embeddings = grown
+
+        row = self._next_row % len(self._embeddings)
+        self._embeddings[row] = embedding
+        if row == len(self._values):
+            self._values.append(value)
+        else:
+            self._values[row] = value
+        self._count = min(self._count + 1, len(self._embeddings))
+        self._next_row = row + 1
+
+    def most_similar(self, embedding: np.ndarray) -> Optional[Tuple[float, Any]]:
+        """Return (cosine similarity, value) of the closest entry, or None when the index is empty"""
+        if self._count == 0:
+            return None
+        # Embeddings are normalized, so the dot product is the cosine similarity
+        similarities = self._embeddings[:self._count] @ embedding
+        best = int(np.argmax(similarities))
+        return float(similarities[best]), self._values[best]
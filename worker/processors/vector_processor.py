@@ -7,20 +7,28 @@ import vertexai
 from vertexai.language_models import TextEmbeddingModel
 import numpy as np
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Texts per Vertex AI embedding request (the get_embeddings instance limit)
+EMBEDDING_BATCH_SIZE = 250
+EMBEDDING_DIMENSION = 768  # Gecko model dimension
+
 class VectorProcessor:
     """Process transcripts using Vertex AI vectorization for enhanced Gemini processing"""
     
-    def __init__(self, project_id: str, location: str = "us-central1"):
+    def __init__(self, project_id: str, location: str = "us-central1", max_workers: int = 16):
         self.project_id = project_id
         self.location = location
         self.embedding_model = None
         self.index = None
         self.endpoint = None
         
+        # The Vertex AI SDK is synchronous; embedding calls run here so they don't block the event loop
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        
         try:
             # Initialize Vertex AI
             vertexai.init(project=project_id, location=location)
@@ -39,15 +47,16 @@ class VectorProcessor:
         try:
             logger.info(f"🧠 Vectorizing {len(transcripts)} transcripts...")
             
-            vectorized_chunks = []
+            # Split every transcript into semantic chunks first, so all chunk texts are embedded together
+            chunked_transcripts = [(transcript, self._create_semantic_chunks(transcript)) for transcript in transcripts]
+            embeddings = iter(await self._generate_embeddings([
+                chunk['text'] for _, chunks in chunked_transcripts for chunk in chunks
+            ]))
             
-            for transcript in transcripts:
-                # Split transcript into semantic chunks
-                chunks = self._create_semantic_chunks(transcript)
-                
+            vectorized_chunks = []
+            for transcript, chunks in chunked_transcripts:
                 for i, chunk in enumerate(chunks):
-                    # Generate embeddings for each chunk
-                    embedding = await self._generate_embedding(chunk['text'])
+                    embedding = next(embeddings)
                     
                     vectorized_chunk = {
                         'id': f"{transcript.get('filename', 'unknown')}_chunk_{i}",
@@ -124,23 +133,37 @@ class VectorProcessor:
         return chunks
     
     async def _generate_embedding(self, text: str) -> List[float]:
-        """Generate text embedding using Vertex AI"""
+        """Generate text embedding using Vertex AI without blocking the event loop"""
+        return (await self._generate_embeddings([text]))[0]
+    
+    async def _generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in EMBEDDING_BATCH_SIZE requests sent concurrently from the thread pool, preserving order"""
+        loop = asyncio.get_running_loop()
+        batches = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, self._generate_embeddings_sync, texts[start:start + EMBEDDING_BATCH_SIZE])
+            for start in range(0, len(texts), EMBEDDING_BATCH_SIZE)
+        ))
+        return [embedding for batch in batches for embedding in batch]
+    
+    def _generate_embeddings_sync(self, texts: List[str]) -> List[List[float]]:
+        """Generate text embeddings for one batch using Vertex AI (blocking)"""
         try:
-            embeddings = self.embedding_model.get_embeddings([text])
-            return embeddings[0].values
+            return [embedding.values for embedding in self.embedding_model.get_embeddings(texts)]
         except Exception as e:
-            logger.error(f"⚠️ Error generating embedding: {e}")
-            # Return zero vector as fallback
-            return [0.0] * 768  # Gecko model dimension
+            logger.error(f"⚠️ Error generating embeddings: {e}")
+            # Return zero vectors as fallback
+            return [[0.0] * EMBEDDING_DIMENSION for _ in texts]
     
-    def find_similar_chunks(self, query: str, chunks: List[Dict[str, Any]], top_k: int = 5) -> List[Dict[str, Any]]:
+    async def find_similar_chunks(self, query: str, chunks: List[Dict[str, Any]], top_k: int = 5) -> List[Dict[str, Any]]:
         """Find most similar chunks to a query using vector similarity"""
         if not self.embedding_model or not chunks:
             return chunks[:top_k]
+        if not any(chunk.get('embedding') for chunk in chunks):
+            return []  # Nothing to compare against, so skip the query embedding call
         
         try:
-            # Generate query embedding
-            query_embedding = asyncio.run(self._generate_embedding(query))
+            # Generate query embedding off the event loop
+            query_embedding = await self._generate_embedding(query)
             
             # Calculate similarities
             similarities = []
@@ -175,14 +198,14 @@ class VectorProcessor:
             logger.error(f"Error calculating cosine similarity: {e}")
             return 0.0
     
-    def get_context_for_extraction(self, user_story: str, chunks: List[Dict[str, Any]], context_window: int = 3) -> List[Dict[str, Any]]:
+    async def get_context_for_extraction(self, user_story: str, chunks: List[Dict[str, Any]], context_window: int = 3) -> List[Dict[str, Any]]:
         """Get relevant context chunks for user story extraction"""
         if not chunks:
             return []
         
         try:
             # Find most similar chunks to the user story
-            similar_chunks = self.find_similar_chunks(user_story, chunks, top_k=context_window)
+            similar_chunks = await self.find_similar_chunks(user_story, chunks, top_k=context_window)
             
             # Add surrounding context
             context_chunks = []